@@ -7,20 +7,27 @@ and scheduler allowing for automated tests of the network.
 
 """
 
-import logging
 import json
+import logging
+import signal
 import threading
 import sys
 
-from uuid import uuid4
-from flask import Flask, request, jsonify
+import requests
+
+from flask import Flask, Response, request, jsonify, g
 from argparse import ArgumentParser
 from functools import wraps
 
 from coin.bogchain import Bogchain
-from coin.key_pair import KeyPair
+from coin.verification import TransactionVerifier
+from coin.key_pair import KeyPair, fingerprint
 from coin.gossip import Gossip
-from coin.test_scheduler import TestScheduler
+from coin.peers import Peers
+from coin.relay import TransactionRelay
+from coin.snapshot import Snapshot
+from coin.test_scheduler import TestScheduler, ScheduleError
+from coin import wire, metrics, profiling, checks
 
 
 # todo sprawdzanie Genesis
@@ -31,11 +38,115 @@ app_kill_event = threading.Event()
 
 app = Flask(__name__)
 
-node_id = str(uuid4()).replace('-', '')
+# node state is built by init_node so that importing the module stays cheap
+node_id = None
+key_pair = None
+peers = None
+gossip = None
+bogchain = None
+relay = None
+
+
+def init_node(**kwargs):
+    """build state of the node served by the module level app
+
+    app is a singleton and its routes read node state from module globals,
+    so there is only one node per process. init_node fills the globals and
+    returns the same app on every call, calling it again replaces state of
+    the previous node.
+
+    Keyword Arguments:
+        key_file (str): path of pem key file, node key pair is loaded from it or
+            generated and saved there if file does not exist
+        key_pair (coin.KeyPair): key pair used instead of key file, new key pair is generated
+            if neither is provided
+
+    Node id is fingerprint of the node public key, so peers recognize node
+    restarted with the same key file and transactions sent by the node can
+    be verified by anyone.
+
+    Returns:
+        Flask: module level app serving the node
+    """
+    global node_id, key_pair, peers, gossip, bogchain, relay
+
+    if kwargs.get('key_file') is not None:
+        key_pair = KeyPair.from_file(kwargs['key_file'])
+    else:
+        key_pair = kwargs['key_pair'] if kwargs.get('key_pair') is not None else KeyPair()
+
+    node_id = fingerprint(key_pair.pub_key)
+    peers = Peers()
+    gossip = Gossip(logger=app.logger, key_pair=key_pair, node_id=node_id, peers=peers)
+    bogchain = Bogchain(node_id=node_id, logger=app.logger, gossip=gossip, peers=peers,
+                        verifier=TransactionVerifier())
+    relay = TransactionRelay(gossip=gossip, peers=peers)
+
+    metrics.mempool_depth.set_function(lambda: bogchain.pending_transactions)
+    metrics.event_subscribers.set_function(lambda: len(bogchain.events))
+    metrics.chain_length.set_function(lambda: bogchain.height)
+
+    return app
+
+
+def load_trusted_snapshot(source, trusted_hash):
+    """start node from snapshot of another node instead of genesis block
+
+    Parameters:
+        source (str): url of /snapshot endpoint of a node or path of file with its response
+        trusted_hash (str): expected hash of the snapshot obtained from trusted source
+
+    Raises:
+        ValueError: when snapshot can't be read, its hash doesn't match trusted hash
+            or blocks following it are invalid
+    """
+    try:
+        if source.startswith('http://') or source.startswith('https://'):
+            response = requests.get(source, timeout=gossip.timeout)
+            response.raise_for_status()
+            snapshot_json = response.json()
+        else:
+            with open(source, 'r') as f:
+                snapshot_json = json.load(f)
+
+        snapshot = Snapshot.from_dict(snapshot_json['snapshot'])
+    except (OSError, requests.RequestException, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Can't read snapshot {source}: {e}")
+
+    if snapshot.hash != trusted_hash:
+        raise ValueError(f"Snapshot hash {snapshot.hash} doesn't match trusted hash {trusted_hash}")
+
+    if not bogchain.load_snapshot(snapshot, snapshot_json.get('chain', [])):
+        raise ValueError("Blocks following the snapshot are invalid")
+
+
+def get_payload():
+    """decompress and decode post body according to its content encoding and type,
+    decoded body is cached for the request"""
+    if 'payload' not in g:
+        body = wire.decompress(request.get_data(), request.headers.get('Content-Encoding'))
+        g.payload = wire.decode(body, request.mimetype) if body is not None else None
+    return g.payload
+
+
+@app.before_request
+def begin_route_profile():
+    """profile request as a run of its route section while profiling window is open"""
+    g.profile_section = f"route {request.endpoint}"
+    g.profile = profiling.profiler.begin(g.profile_section)
+
+
+@app.teardown_request
+def end_route_profile(exception):
+    profiling.profiler.end(g.pop('profile_section', None), g.pop('profile', None))
 
-key_pair = KeyPair()
-gossip = Gossip(logger=app.logger, key_pair=key_pair, node_id=node_id)
-bogchain = Bogchain(node_id=node_id, logger=app.logger, gossip=gossip)
+
+@app.after_request
+def advertise_formats(response):
+    """let peers know which wire formats and compressions app accepts"""
+    response.headers['Accept-Post'] = ', '.join(wire.formats)
+    response.headers['Accept-Encoding'] = ', '.join(wire.encodings)
+    return response
 
 
 def check_post_keys(required):
@@ -43,9 +154,22 @@ def check_post_keys(required):
     def decorator(f):
         @wraps(f)
         def decorated_func(*args, **kwargs):
-            pending_json = request.get_json()
-            if not all(key in pending_json for key in required):
-                return "Missing required values", 400
+            error = checks.check_keys(get_payload(), required)
+            if error is not None:
+                return error
+            return f(*args, **kwargs)
+        return decorated_func
+    return decorator
+
+
+def check_batch_keys(required):
+    """verify if every transaction of a batch post request contains necessary keys"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_func(*args, **kwargs):
+            error = checks.check_batch_keys(get_payload()['transactions'], required)
+            if error is not None:
+                return error
             return f(*args, **kwargs)
         return decorated_func
     return decorator
@@ -56,19 +180,13 @@ def verify_signature_foreign(f):
     @wraps(f)
     def decorated_func(*args, **kwargs):
         signature = request.headers.get('signature')
-        origin_id = request.headers.get('origin-id')
-
-        if not any([signature, origin_id]):
-            return "Invalid request", 400
+        pub_key = bogchain.peers.get_pub_key(request.headers.get('origin-id'))
 
-        data = json.dumps(request.get_json(), sort_keys=True)
-        pub_key = bogchain.peers.get_pub_key(origin_id)
+        with metrics.signature_verify_duration.time(route=request.endpoint):
+            error = checks.check_signature(signature, get_payload(), pub_key)
 
-        if pub_key is None:
-            return "Node not registered", 403
-
-        if KeyPair.verify(signature, data, pub_key) is False:
-            return "Invalid signature", 403
+        if error is not None:
+            return error
         return f(*args, **kwargs)
     return decorated_func
 
@@ -79,14 +197,11 @@ def verify_signature_local(f):
     def decorated_func(*args, **kwargs):
         signature = request.headers.get('signature')
 
-        if not signature:
-            return "Invalid request", 400
-
-        data = json.dumps(request.get_json(), sort_keys=True)
-        pub_key = key_pair.pub_key
+        with metrics.signature_verify_duration.time(route=request.endpoint):
+            error = checks.check_signature(signature, get_payload(), key_pair.pub_key)
 
-        if KeyPair.verify(signature, data, pub_key) is False:
-            return "Invalid signature", 403
+        if error is not None:
+            return error
         return f(*args, **kwargs)
     return decorated_func
 
@@ -104,53 +219,188 @@ def test_post():
 def new_transaction():
     """Endpoint for creating new transaction, new transaction is then
     broadcasted to app peers"""
-    trans_json = request.get_json()
-    trans_json['sender'] = node_id
-    trans_json['id'] = str(uuid4())
+    trans_json = get_payload()
 
-    gossip.flood("/transactions/process", trans_json, bogchain.peers.addresses)
+    try:
+        transactions = bogchain.new_transactions([trans_json], key_pair)
+    except TypeError as e:
+        return str(e), 400
+
+    relay.add([transaction.to_dict() for transaction in transactions])
 
     response = f"Outgoing transaction {trans_json['amount']} to {trans_json['recipient']}"
 
     return response, 201
 
 
+@app.route('/transactions/new/batch', methods=['POST'])
+@check_post_keys(['transactions'])
+@check_batch_keys(['recipient', 'amount'])
+@verify_signature_local
+def new_transactions_batch():
+    """Endpoint for creating many transactions under a single signature,
+    transactions are broadcasted to app peers in batches"""
+    try:
+        transactions = bogchain.new_transactions(get_payload()['transactions'], key_pair)
+    except TypeError as e:
+        return str(e), 400
+
+    relay.add([transaction.to_dict() for transaction in transactions])
+
+    return f"Outgoing transactions batch of {len(transactions)}", 201
+
+
 @app.route('/transactions/process', methods=['POST'])
 @check_post_keys(['sender', 'recipient', 'amount', 'id'])
 @verify_signature_foreign
 def process_transaction():
     """Endpoint for processing new transactions received from peer apps"""
-    trans_json = request.get_json()
+    trans_json = get_payload()
 
     response = f"New transaction {trans_json['amount']} from {trans_json['sender']} to {trans_json['recipient']}"
 
-    if bogchain.evil:
-        return response, 201
+    error = bogchain.receive_transactions([trans_json])
+
+    if error is not None:
+        return error
+
+    app.logger.debug(response)
+
+    return response, 201
+
+
+@app.route('/transactions/process/batch', methods=['POST'])
+@check_post_keys(['transactions'])
+@check_batch_keys(['sender', 'recipient', 'amount', 'id'])
+@verify_signature_foreign
+def process_transactions_batch():
+    """Endpoint for processing batches of transactions relayed by peer apps"""
+    transactions = get_payload()['transactions']
+
+    response = f"New transactions batch of {len(transactions)}"
+
+    error = bogchain.receive_transactions(transactions)
 
-    bogchain.awaiting_transactions.append(trans_json)
-    if not bogchain.wake_transaction_handler.is_set():
-        bogchain.wake_transaction_handler.set()
+    if error is not None:
+        return error
 
     app.logger.debug(response)
 
     return response, 201
 
 
+@app.route('/transactions/<transaction_id>/proof', methods=['GET'])
+def transaction_proof(transaction_id):
+    """return merkle proof of inclusion of a transaction in the chain"""
+    proof = bogchain.transaction_proof(transaction_id)
+
+    if proof is None:
+        return jsonify({'message': f"Transaction {transaction_id} not found"}), 404
+
+    return jsonify(proof), 200
+
+
 @app.route('/chain', methods=['GET'])
 def full_chain():
     """return blockchain in json format"""
     response = {
-        'chain': bogchain.chain,
-        'length': len(bogchain.chain)
+        'chain': [block.to_dict() for block in bogchain.chain],
+        'length': bogchain.height,
+        'snapshot_height': bogchain.snapshot.height
     }
 
+    # json goes first so clients accepting anything (curl, browsers) keep getting json
+    mimetype = request.accept_mimetypes.best_match([wire.JSON, *wire.formats], default=wire.JSON)
+
+    if mimetype != wire.JSON:
+        return Response(wire.encode(response, mimetype), mimetype=mimetype), 200
+
     return jsonify(response), 200
 
 
+@app.route('/snapshot', methods=['GET'])
+def chain_snapshot():
+    """return snapshot of pruned blocks, its hash and blocks following it,
+    new nodes can start from it with --snapshot and --snapshot-hash options"""
+    return jsonify(bogchain.snapshot_state), 200
+
+
+@app.route('/events', methods=['GET'])
+def event_stream():
+    """stream new blocks, reorgs and accepted transactions as server-sent events
+
+    Query parameter kinds limits stream to comma separated kinds of events:
+    block, reorg or transaction. Subscribers not keeping up are dropped.
+    """
+    kinds = request.args.get('kinds')
+    kinds = kinds.split(',') if kinds else None
+
+    if kinds is not None and not all(kind in bogchain.events.kinds for kind in kinds):
+        return f"Unknown kind of events, known kinds: {', '.join(bogchain.events.kinds)}", 400
+
+    subscriber = bogchain.events.subscribe(kinds)
+
+    if subscriber is None:
+        return "Too many subscribers", 503
+
+    return Response(bogchain.events.stream(subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'}), 200
+
+
+@app.route('/stats/compression', methods=['GET'])
+def compression_stats():
+    """return bytes saved by compressing outgoing payloads and cpu time spent on it"""
+    return jsonify(gossip.compression_stats.as_dict()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def node_metrics():
+    """return node metrics in prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4'), 200
+
+
+@app.route('/profile', methods=['GET'])
+def profile_report():
+    """return statistics collected in the last profiling window as text
+
+    Query parameters sort, limit and section select pstats sort key, number
+    of listed functions and the only section to be reported.
+    """
+    try:
+        limit = int(request.args.get('limit', 30))
+        report = profiling.profiler.report(request.args.get('sort', 'cumulative'), limit,
+                                           request.args.get('section'))
+    except (KeyError, ValueError):
+        return "Invalid sort key or limit", 400
+
+    return Response(report, mimetype='text/plain'), 200
+
+
+@app.route('/profile', methods=['POST'])
+@check_post_keys(['duration'])
+@verify_signature_local
+def start_profile():
+    """open profiling window of given duration, optionally limited to listed sections"""
+    profile_json = get_payload()
+
+    if not isinstance(profile_json['duration'], (int, float)) or profile_json['duration'] <= 0:
+        return "Duration has to be a positive number", 400
+
+    sections = profile_json.get('sections')
+
+    if sections is not None and (not isinstance(sections, list)
+                                 or not all(isinstance(section, str) for section in sections)):
+        return "Sections have to be a list of section names", 400
+
+    profiling.profiler.start(profile_json['duration'], sections)
+
+    return jsonify(profiling.profiler.status), 202
+
+
 @app.route('/peers', methods=['GET'])
 def nodes():
-    """return app peers in json format"""
-    return jsonify(bogchain.peers.node_ids)
+    """return app peers along with their health in json format"""
+    return jsonify(bogchain.peers.stats)
 
 
 @app.route('/nodes/register', methods=['POST'])
@@ -164,31 +414,9 @@ def register_nodes():
     sent. Then ff response was received by new peer, app broadcasts
     new peer list to all its old peers excluding new peer
     """
-    node = request.get_json()
+    body, status = bogchain.register_peer(get_payload(), "Registration-Resp" not in request.headers)
 
-    if node is None:
-        return "No nodes provided", 400
-
-    if bogchain.peers.add_peer(node['address'], node['node_id'], node['pub_key']):
-        new_node_id = node['node_id']
-        app.logger.debug(f"Registered new node {new_node_id}")
-
-        if "Registration-Resp" not in request.headers:
-            register_resp_success = gossip.register_response(node['address'], bogchain.current_state)
-            if register_resp_success:
-                gossip.flood("/update", bogchain.current_state, bogchain.peers.addresses, [node['address']])
-    else:
-        message = f"Node {node['node_id']} already exists"
-        app.logger.debug(message)
-
-        return jsonify({'message': message}), 409
-
-    response = {
-        'message': 'Node added',
-        'new_node': node
-    }
-
-    return jsonify(response), 201
+    return jsonify(body), status
 
 
 @app.route('/update', methods=['POST'])
@@ -196,37 +424,19 @@ def register_nodes():
 @verify_signature_foreign
 def update_state():
     """Endpoint for receiving updates from peer apps"""
-    update_json = request.get_json()
+    response = bogchain.receive_update(get_payload(), request.headers.get('origin-id'))
 
-    updated = bogchain.update_chain(update_json['chain'])
-
-    if updated and bogchain.mining_task is not None:
+    if response['updated'] and bogchain.mining_task is not None:
         bogchain.mining_task.cancel()
         app.logger.info("Recieved new update cancelling mining task")
 
-    new_peers = bogchain.update_peers(update_json['peers'])
-
-    response = {
-        'new_peers': new_peers,
-        'updated': updated
-    }
-
     return jsonify(response), 200
 
 
 @app.route('/balance', methods=['GET'])
 def balance():
     """Endpoint returning current bogo coin balance"""
-    bogs = 0
-
-    for block in bogchain.chain:
-        for transaction in block['transactions']:
-            if transaction['sender'] == node_id:
-                bogs -= transaction['amount']
-            elif transaction['recipient'] == node_id:
-                bogs += transaction['amount']
-
-    return jsonify({'balance': bogs}), 200
+    return jsonify({'balance': bogchain.balance(node_id)}), 200
 
 
 @app.route('/node_id', methods=['GET'])
@@ -246,6 +456,37 @@ if __name__ == '__main__':
     arg_parser.add_argument('-a', '--accumulation', default=0.5, type=float,
                             help="time in seconds app waits before it starts to mine transactions into new block, defaults to 0.5s")
     arg_parser.add_argument('-T', '--throttle', default=None, type=float, help="arbitrary slowdown of mining speed")
+    arg_parser.add_argument('--peer-timeout', default=3.0, type=float,
+                            help="time in seconds after which request to peer is abandoned, defaults to 3s")
+    arg_parser.add_argument('-c', '--compression-threshold', default=1024, type=int,
+                            help="minimal size in bytes of payload compressed before sending to peers, "
+                                 "negative value disables compression, defaults to 1024")
+    arg_parser.add_argument('-r', '--relay-window', default=0.05, type=float,
+                            help="time in seconds outgoing transactions are collected into a single batch "
+                                 "sent to peers, 0 sends every transaction right away, defaults to 0.05s")
+    arg_parser.add_argument('--max-peers', default=32, type=int,
+                            help="maximal number of peers in peer table, defaults to 32")
+    arg_parser.add_argument('--max-outbound', default=8, type=int,
+                            help="number of peers app connects to on its own through peer exchange, "
+                                 "defaults to 8")
+    arg_parser.add_argument('--prune-depth', default=None, type=int,
+                            help="number of newest blocks kept in memory, older blocks are folded into snapshot, "
+                                 "whole chain is kept if not specified")
+    arg_parser.add_argument('--archive', default=None, type=str,
+                            help="path of file pruned blocks are appended to, pruned blocks are dropped if not specified")
+    arg_parser.add_argument('--snapshot', default=None, type=str,
+                            help="url of /snapshot endpoint of a node or path of file with its response, "
+                                 "node starts from the snapshot instead of genesis block")
+    arg_parser.add_argument('--snapshot-hash', default=None, type=str,
+                            help="trusted hash of the snapshot, required with --snapshot")
+    arg_parser.add_argument('--profile-window', default=30.0, type=float,
+                            help="time in seconds node is profiled after receiving SIGUSR1, defaults to 30s")
+    arg_parser.add_argument('--event-buffer', default=1000, type=int,
+                            help="number of events buffered for each /events subscriber, subscribers "
+                                 "falling further behind are dropped, defaults to 1000")
+    arg_parser.add_argument('-k', '--key-file', default=None, type=str,
+                            help="path of pem file with node private key, created if it does not exist, "
+                                 "random key and node id are used if not specified")
 
     cl_args = arg_parser.parse_args()
     port = cl_args.port
@@ -254,18 +495,49 @@ if __name__ == '__main__':
     schedule_file = cl_args.schedule
     accumulation_period = cl_args.accumulation
     throttle = cl_args.throttle
+    compression_threshold = cl_args.compression_threshold
+    peer_timeout = cl_args.peer_timeout
+
+    init_node(key_file=cl_args.key_file)
 
     if verbose:
         app.logger.setLevel(logging.DEBUG)
 
+    if cl_args.prune_depth is not None and cl_args.prune_depth < 1:
+        arg_parser.error("prune depth has to be at least 1")
+
+    bogchain.prune_depth = cl_args.prune_depth
+    bogchain.archive_path = cl_args.archive
+
+    if cl_args.snapshot is not None:
+        if genesis or cl_args.snapshot_hash is None:
+            arg_parser.error("--snapshot requires --snapshot-hash and can't be used with --genesis")
+
+        try:
+            load_trusted_snapshot(cl_args.snapshot, cl_args.snapshot_hash)
+        except ValueError as e:
+            arg_parser.error(str(e))
+
     if genesis:
         bogchain.create_genesis_block()
 
     if throttle:
         bogchain.throttle = throttle
 
+    gossip.compression_threshold = compression_threshold if compression_threshold >= 0 else None
+    gossip.timeout = peer_timeout
+    relay.window = cl_args.relay_window
+    peers.max_peers = cl_args.max_peers
+    peers.max_outbound = cl_args.max_outbound
+    bogchain.events.buffer = cl_args.event_buffer
+
     gossip.local_url = f"http://127.0.0.1:{port}"
 
+    profiling.profiler.window = cl_args.profile_window
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiling.profiler.start())
+
     test_schedule = TestScheduler(schedule_file,
                                   app_kill_event=app_kill_event,
                                   bogchain=bogchain,
@@ -274,6 +546,11 @@ if __name__ == '__main__':
                                   node_id=node_id,
                                   gossip=gossip)
 
+    try:
+        schedule_plan = test_schedule.compile()
+    except ScheduleError as e:
+        arg_parser.error(f"invalid schedule file {schedule_file}\n{e}")
+
     app_thread = threading.Thread(target=app.run,
                                   kwargs={'host': "0.0.0.0", 'port': port},
                                   daemon=True)
@@ -282,7 +559,9 @@ if __name__ == '__main__':
                                                   kwargs={'accumulation_period': accumulation_period},
                                                   daemon=True)
 
-    scheduler_thread = threading.Thread(target=test_schedule.execute, daemon=True)
+    scheduler_thread = threading.Thread(target=test_schedule.execute,
+                                        kwargs={'plan': schedule_plan},
+                                        daemon=True)
 
     app_thread.start()
     transaction_handler_thread.start()
@@ -0,0 +1,92 @@
+"""Benchmark suite runner
+
+Runs selected benchmarks and writes results as json together with commit
+and interpreter they were measured on, so runs can be compared between
+commits.
+
+Usage:
+    python -m benchmarks [-o OUTPUT] [-q] [benchmark ...]
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from argparse import ArgumentParser
+
+from benchmarks import chain, gossip, memory, mining, signing, transactions, verification, wire_formats
+
+
+suites = {
+    'mining': (mining.run, {'difficulties': (2, 3, 4)}),
+    'chain': (chain.run, {'lengths': (10, 100)}),
+    'signing': (signing.run, {'operations': 50}),
+    'transactions': (transactions.run, {'requests': 100, 'batch_size': 50}),
+    'verification': (verification.run, {'transactions': 200}),
+    'gossip': (gossip.run, {'peer_counts': (1, 4)}),
+    'wire_formats': (wire_formats.run, {'blocks': 20}),
+    'memory': (memory.run, {'transactions': 100000})
+}
+
+
+def current_commit():
+    """return hash of checked out commit, None outside of git repository"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, quick=False):
+    """run benchmarks
+
+    Parameters:
+        names (list): names of benchmarks to run
+        quick (bool): run with smaller parameters
+
+    Returns:
+        dict: environment description and results of every benchmark
+    """
+    results = {}
+
+    for name in names:
+        func, quick_kwargs = suites[name]
+        print(f"Running {name}", file=sys.stderr)
+
+        start = time.perf_counter()
+        results[name] = func(**quick_kwargs) if quick else func()
+        print(f"Finished {name} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    return {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'quick': quick,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(prog='python -m benchmarks')
+    arg_parser.add_argument('benchmarks', nargs='*', default=[],
+                            help=f"benchmarks to run, one of {', '.join(suites)}, defaults to all")
+    arg_parser.add_argument('-o', '--output', default=None, type=str,
+                            help="path of json file with results, printed to stdout if not specified")
+    arg_parser.add_argument('-q', '--quick', action="store_true", help="run with smaller parameters")
+
+    cl_args = arg_parser.parse_args()
+
+    unknown = [name for name in cl_args.benchmarks if name not in suites]
+    if unknown:
+        arg_parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    report = run(cl_args.benchmarks or list(suites), cl_args.quick)
+
+    if cl_args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(cl_args.output, 'w') as f:
+            json.dump(report, f, indent=2)
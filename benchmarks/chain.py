@@ -0,0 +1,80 @@
+"""valid_chain and update_chain throughput against chain length
+
+Chains are built at low difficulty, validation cost does not depend on it.
+
+Usage:
+    python -m benchmarks.chain [-l LENGTH ...] [-t TRANSACTIONS] [-r REPEAT]
+"""
+
+import json
+
+from argparse import ArgumentParser
+
+from coin.bogchain import Bogchain
+from coin.block import Block, BlockTemplate, Transaction
+from benchmarks.common import best_time, logger, rate
+
+
+def build_chain(length, transactions):
+    """mine valid chain of given length
+
+    Returns:
+        coin.Bogchain: bogchain holding mined chain
+    """
+    bogchain = Bogchain(node_id='benchmark', gossip=None, logger=logger)
+    bogchain.create_genesis_block()
+
+    for _ in range(1, length):
+        template = BlockTemplate(bogchain.height, bogchain.clock.time(), bogchain.last_block.hash,
+                                 [Transaction('a', 'b', i) for i in range(transactions)])
+        bogchain.append_block(template.block(bogchain.proof_of_work(template.work_hash)))
+
+    return bogchain
+
+
+def run(lengths=(10, 100, 1000), transactions=10, repeat=3):
+    """run benchmark
+
+    Returns:
+        dict: dict mapping chain length to blocks per second of valid_chain and update_chain
+    """
+    default_difficulty = Bogchain.difficulty
+    Bogchain.difficulty = 1
+    results = {}
+
+    try:
+        for length in lengths:
+            source = build_chain(length, transactions)
+            received = source.current_state['chain']
+
+            # fresh blocks for every repetition so cached hashes do not hide hashing cost
+            copies = [[Block.from_dict(block) for block in received] for _ in range(repeat)]
+
+            def validate():
+                source.valid_chain(copies.pop())
+
+            def update():
+                receiver = Bogchain(node_id='receiver', gossip=None, logger=logger)
+                receiver.update_chain(received)
+
+            results[str(length)] = {
+                'valid_chain_blocks_per_second': rate(length, best_time(validate, repeat)),
+                'update_chain_blocks_per_second': rate(length, best_time(update, repeat))
+            }
+    finally:
+        Bogchain.difficulty = default_difficulty
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-l', '--length', default=[10, 100, 1000], type=int, nargs='+',
+                            help="chain lengths, defaults to 10 100 1000")
+    arg_parser.add_argument('-t', '--transactions', default=10, type=int,
+                            help="transactions in each block, defaults to 10")
+    arg_parser.add_argument('-r', '--repeat', default=3, type=int, help="number of repetitions, defaults to 3")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.length, cl_args.transactions, cl_args.repeat), indent=2))
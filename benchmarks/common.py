@@ -0,0 +1,24 @@
+"""Helpers shared by benchmarks"""
+
+import logging
+import time
+
+
+logger = logging.getLogger('benchmarks')
+
+
+def best_time(func, repeat):
+    """return best time of repeated calls in seconds"""
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def rate(operations, seconds):
+    """operations per second rounded for reporting"""
+    return round(operations / seconds, 1) if seconds > 0 else None
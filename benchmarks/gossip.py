@@ -0,0 +1,86 @@
+"""Gossip.flood latency against number of peers
+
+Peers are stood in by a single local http server, each peer gets its own
+address prefix so they are tracked separately by coin.Peers.
+
+Usage:
+    python -m benchmarks.gossip [-p PEERS ...] [-r REPEAT]
+"""
+
+import json
+import threading
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from coin.gossip import Gossip
+from coin.key_pair import KeyPair
+from coin.peers import Peers
+from coin import wire
+from benchmarks.common import best_time, logger
+from benchmarks.wire_formats import make_state
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Accepts any post like a peer accepting an update"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Accept-Post', ', '.join(wire.formats))
+        self.send_header('Accept-Encoding', ', '.join(wire.encodings))
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+def run(peer_counts=(1, 4, 16), repeat=5, blocks=20):
+    """run benchmark
+
+    Returns:
+        dict: dict mapping number of peers to flood time in milliseconds
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    key_pair = KeyPair()
+    state = make_state(blocks, 10)
+    results = {}
+
+    try:
+        for peer_count in peer_counts:
+            # every fake peer shares the benchmark key, so their ids can't be fingerprints
+            peers = Peers(max_peers=peer_count, verify_ids=False)
+            for i in range(peer_count):
+                peers.add_peer(f"http://127.0.0.1:{port}/peer{i}", f"peer{i}", key_pair.pub_key)
+
+            gossip = Gossip(logger=logger, key_pair=key_pair, node_id='benchmark', peers=peers)
+            # first flood negotiates wire format and compression with every peer
+            gossip.flood('/update', state, peers.addresses)
+
+            flood_time = best_time(lambda: gossip.flood('/update', state, peers.addresses), repeat)
+            results[str(peer_count)] = {
+                'flood_ms': round(flood_time * 1e3, 3),
+                'per_peer_ms': round(flood_time * 1e3 / peer_count, 3)
+            }
+    finally:
+        server.shutdown()
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-p', '--peers', default=[1, 4, 16], type=int, nargs='+',
+                            help="numbers of peers, defaults to 1 4 16")
+    arg_parser.add_argument('-r', '--repeat', default=5, type=int, help="number of repetitions, defaults to 5")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.peers, cl_args.repeat), indent=2))
@@ -0,0 +1,80 @@
+"""Memory used by transactions kept as dicts and as coin.Transaction
+
+Usage:
+    python -m benchmarks.memory [-t TRANSACTIONS] [-n NODES] [-b BLOCK_SIZE]
+"""
+
+import json
+import tracemalloc
+
+from argparse import ArgumentParser
+from uuid import uuid4
+
+from coin.block import Block
+
+
+def make_body(transactions, nodes, block_size):
+    """build json encoded chain as it arrives from the wire"""
+    node_ids = [uuid4().hex for _ in range(nodes)]
+
+    chain = [{'index': index,
+              'timestamp': 0.0,
+              'transactions': [{'sender': node_ids[i % nodes],
+                                'recipient': node_ids[(i + 1) % nodes],
+                                'amount': i % 100,
+                                'id': str(uuid4())} for i in range(start, min(start + block_size, transactions))],
+              'proof': 0,
+              'previous_hash': uuid4().hex * 2,
+              'merkle_root': uuid4().hex * 2} for index, start in enumerate(range(0, transactions, block_size))]
+
+    return json.dumps(chain)
+
+
+def traced_size(build):
+    """return number of bytes allocated by build and still alive after it returns"""
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def run(transactions=1000000, nodes=100, block_size=100):
+    """run benchmark
+
+    Returns:
+        dict: bytes used by chain of transaction dicts and chain of coin.Block
+    """
+    body = make_body(transactions, nodes, block_size)
+
+    def dict_chain():
+        return json.loads(body)
+
+    def slots_chain():
+        return [Block.from_dict(block) for block in json.loads(body)]
+
+    dict_bytes = traced_size(dict_chain)
+    slots_bytes = traced_size(slots_chain)
+
+    return {
+        'transactions': transactions,
+        'dict_bytes': dict_bytes,
+        'slots_bytes': slots_bytes,
+        'dict_bytes_per_transaction': round(dict_bytes / transactions, 1),
+        'slots_bytes_per_transaction': round(slots_bytes / transactions, 1),
+        'ratio': round(dict_bytes / slots_bytes, 2)
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-t', '--transactions', default=1000000, type=int,
+                            help="number of transactions, defaults to 1000000")
+    arg_parser.add_argument('-n', '--nodes', default=100, type=int, help="number of distinct node ids, defaults to 100")
+    arg_parser.add_argument('-b', '--block-size', default=100, type=int,
+                            help="transactions in each block, defaults to 100")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.transactions, cl_args.nodes, cl_args.block_size), indent=2))
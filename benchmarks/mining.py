@@ -0,0 +1,55 @@
+"""Proof of work hashes per second at several difficulties
+
+Usage:
+    python -m benchmarks.mining [-d DIFFICULTY ...] [-r REPEAT]
+"""
+
+import json
+import time
+
+from argparse import ArgumentParser
+
+from coin.bogchain import Bogchain
+from benchmarks.common import logger, rate
+
+
+def run(difficulties=(2, 3, 4, 5), repeat=3):
+    """run benchmark
+
+    Returns:
+        dict: dict mapping difficulty to hashes per second and mean proof time in milliseconds
+    """
+    bogchain = Bogchain(node_id='benchmark', gossip=None, logger=logger)
+    default_difficulty = Bogchain.difficulty
+    results = {}
+
+    try:
+        for difficulty in difficulties:
+            Bogchain.difficulty = difficulty
+            hashes = 0
+            start = time.perf_counter()
+
+            # consecutive integers stand in for work hashes of block templates
+            for work_hash in range(repeat):
+                hashes += bogchain.proof_of_work(work_hash) + 1
+
+            elapsed = time.perf_counter() - start
+            results[str(difficulty)] = {
+                'hashes_per_second': rate(hashes, elapsed),
+                'proof_ms': round(elapsed * 1e3 / repeat, 3)
+            }
+    finally:
+        Bogchain.difficulty = default_difficulty
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-d', '--difficulty', default=[2, 3, 4, 5], type=int, nargs='+',
+                            help="difficulties to measure, defaults to 2 3 4 5")
+    arg_parser.add_argument('-r', '--repeat', default=3, type=int, help="proofs computed at each difficulty")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.difficulty, cl_args.repeat), indent=2))
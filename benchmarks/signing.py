@@ -0,0 +1,55 @@
+"""KeyPair.sign and KeyPair.verify operations per second
+
+Usage:
+    python -m benchmarks.signing [-n OPERATIONS]
+"""
+
+import json
+import time
+
+from argparse import ArgumentParser
+
+from coin.key_pair import KeyPair
+from coin import wire
+from benchmarks.common import rate
+
+
+def run(operations=200):
+    """run benchmark
+
+    Returns:
+        dict: key generation time in milliseconds, sign and verify operations per second
+    """
+    start = time.perf_counter()
+    key_pair = KeyPair()
+    # key is generated on first use
+    key_pair.private_key
+    keygen_time = time.perf_counter() - start
+
+    data = wire.canonical({'sender': 'a' * 32, 'recipient': 'b' * 32, 'amount': 10, 'id': 'c' * 36})
+
+    start = time.perf_counter()
+    signatures = [key_pair.sign(data) for _ in range(operations)]
+    sign_time = time.perf_counter() - start
+
+    pub_key = key_pair.pub_key
+    start = time.perf_counter()
+    for signature in signatures:
+        KeyPair.verify(signature, data, pub_key)
+    verify_time = time.perf_counter() - start
+
+    return {
+        'keygen_ms': round(keygen_time * 1e3, 3),
+        'sign_per_second': rate(operations, sign_time),
+        'verify_per_second': rate(operations, verify_time)
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-n', '--operations', default=200, type=int,
+                            help="number of signatures created and verified, defaults to 200")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.operations), indent=2))
@@ -0,0 +1,88 @@
+"""/transactions/process requests per second through Flask test client
+
+Requests and transactions are signed upfront, measured time covers
+decoding, verification of request and transaction signatures and queueing
+of a transaction. Batched submission through
+/transactions/process/batch is measured in transactions per second.
+
+Usage:
+    python -m benchmarks.transactions [-n REQUESTS] [-b BATCH_SIZE]
+"""
+
+import json
+import time
+
+from argparse import ArgumentParser
+from uuid import uuid4
+
+from coin.block import Transaction
+from coin.key_pair import KeyPair, fingerprint
+from coin import wire
+from benchmarks.common import rate
+
+
+def make_transaction(sender, recipient, amount):
+    """return dict of transaction signed by sender key pair"""
+    transaction = Transaction(fingerprint(sender.pub_key), recipient, amount, str(uuid4()))
+    transaction.sign(sender)
+    return transaction.to_dict()
+
+
+def run(requests=500, batch_size=100):
+    """run benchmark
+
+    Returns:
+        dict: requests per second for each wire format, transactions per second of batches
+    """
+    import app
+
+    app.init_node()
+    sender = KeyPair()
+    app.bogchain.peers.add_peer('http://benchmark', fingerprint(sender.pub_key), sender.pub_key)
+    client = app.app.test_client()
+    results = {}
+
+    for mimetype in wire.formats:
+        signed = []
+        for i in range(requests):
+            transaction = make_transaction(sender, app.node_id, i)
+            headers = {'origin-id': fingerprint(sender.pub_key),
+                       'signature': sender.sign(wire.canonical(transaction)),
+                       'Content-Type': mimetype}
+            signed.append((wire.encode(transaction, mimetype), headers))
+
+        start = time.perf_counter()
+        for body, headers in signed:
+            client.post('/transactions/process', data=body, headers=headers)
+        elapsed = time.perf_counter() - start
+
+        app.bogchain.awaiting_transactions = []
+        results[mimetype] = {'requests_per_second': rate(requests, elapsed)}
+
+    batches = []
+    for i in range(max(requests // batch_size, 1)):
+        batch = {'transactions': [make_transaction(sender, app.node_id, j) for j in range(batch_size)]}
+        headers = {'origin-id': fingerprint(sender.pub_key), 'signature': sender.sign(wire.canonical(batch))}
+        batches.append((batch, headers))
+
+    start = time.perf_counter()
+    for batch, headers in batches:
+        client.post('/transactions/process/batch', json=batch, headers=headers)
+    elapsed = time.perf_counter() - start
+
+    app.bogchain.awaiting_transactions = []
+    results['batch'] = {'batch_size': batch_size,
+                        'transactions_per_second': rate(len(batches) * batch_size, elapsed)}
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-n', '--requests', default=500, type=int, help="number of requests, defaults to 500")
+    arg_parser.add_argument('-b', '--batch-size', default=100, type=int,
+                            help="transactions in each batch, defaults to 100")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.requests, cl_args.batch_size), indent=2))
@@ -0,0 +1,76 @@
+"""Transaction signature verification of received chains
+
+Compares verification of all transactions in the calling process, in the
+process pool and of transactions already present in the verified cache.
+
+Usage:
+    python -m benchmarks.verification [-n TRANSACTIONS] [-w WORKERS]
+"""
+
+import json
+import os
+import time
+
+from argparse import ArgumentParser
+
+from coin.block import Transaction
+from coin.key_pair import KeyPair, fingerprint
+from coin.verification import TransactionVerifier
+from benchmarks.common import rate
+
+
+def make_transactions(count, senders=10):
+    """return list of coin.Transaction signed by a few sender key pairs"""
+    key_pairs = [KeyPair() for _ in range(senders)]
+    transactions = []
+
+    for i in range(count):
+        key_pair = key_pairs[i % senders]
+        transaction = Transaction(fingerprint(key_pair.pub_key), 'recipient', i)
+        transaction.sign(key_pair)
+        transactions.append(transaction)
+
+    return transactions
+
+
+def measure(verifier, transactions):
+    """return transactions per second of single verify call"""
+    start = time.perf_counter()
+    verifier.verify(transactions)
+    return rate(len(transactions), time.perf_counter() - start)
+
+
+def run(transactions=2000, workers=None):
+    """run benchmark
+
+    Returns:
+        dict: verified transactions per second for each mode
+    """
+    workers = workers or os.cpu_count() or 1
+    signed = make_transactions(transactions)
+
+    inline = TransactionVerifier(workers=1)
+    results = {'inline_per_second': measure(inline, signed),
+               'cached_per_second': measure(inline, signed)}
+
+    if workers > 1:
+        parallel = TransactionVerifier(workers=workers, parallel_threshold=1)
+        # first call starts worker processes
+        parallel.verify(signed[:workers])
+        results['parallel_per_second'] = measure(parallel, signed)
+        results['workers'] = workers
+        parallel.shutdown()
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-n', '--transactions', default=2000, type=int,
+                            help="number of signed transactions, defaults to 2000")
+    arg_parser.add_argument('-w', '--workers', default=None, type=int,
+                            help="worker processes of the pool, defaults to number of cpus")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.transactions, cl_args.workers), indent=2))
@@ -0,0 +1,94 @@
+"""Size and speed of wire formats used for chain transfers
+
+Compares json path used before format negotiation (json.dumps with sorted
+keys for signing, json body) with every format available in coin.wire.
+
+Usage:
+    python -m benchmarks.wire_formats [-b BLOCKS] [-t TRANSACTIONS] [-r REPEAT]
+"""
+
+import json
+import time
+
+from argparse import ArgumentParser
+from base64 import b64encode
+from os import urandom
+from uuid import uuid4
+
+from coin import wire
+from benchmarks.common import best_time
+
+
+def make_state(blocks, transactions):
+    """build node state resembling Bogchain.current_state
+
+    Parameters:
+        blocks (int): chain length
+        transactions (int): number of transactions in each block
+
+    Returns:
+        dict: dict with chain and peers
+    """
+    node_ids = [uuid4().hex for _ in range(10)]
+    chain = []
+
+    for index in range(blocks):
+        chain.append({
+            'index': index,
+            'timestamp': time.time(),
+            'transactions': [{'sender': node_ids[i % 10],
+                              'recipient': node_ids[(i + 1) % 10],
+                              'amount': i,
+                              'id': str(uuid4())} for i in range(transactions)],
+            'proof': 123456,
+            'previous_hash': urandom(32).hex()
+        })
+
+    peers = {node_id: {'address': f"http://127.0.0.1:{5001 + i}",
+                       'pub_key': b64encode(urandom(294)).decode()} for i, node_id in enumerate(node_ids)}
+
+    return {'chain': chain, 'peers': peers}
+
+
+def measure(func, repeat):
+    """return best time of repeated calls in milliseconds"""
+    return round(best_time(func, repeat) * 1e3, 3)
+
+
+def run(blocks=100, transactions=20, repeat=5):
+    """run benchmark
+
+    Returns:
+        dict: results for each format, sizes in bytes, times in milliseconds
+    """
+    state = make_state(blocks, transactions)
+    results = {}
+
+    legacy_body = json.dumps(state).encode()
+    results['legacy_json'] = {
+        'size': len(legacy_body),
+        'encode_ms': measure(lambda: (json.dumps(state, sort_keys=True), json.dumps(state).encode()), repeat),
+        'decode_ms': measure(lambda: json.dumps(json.loads(legacy_body), sort_keys=True), repeat)
+    }
+
+    for mimetype in wire.formats:
+        body = wire.encode(state, mimetype)
+        results[mimetype] = {
+            'size': len(body),
+            'encode_ms': measure(lambda: (wire.canonical(state), wire.encode(state, mimetype)), repeat),
+            'decode_ms': measure(lambda: wire.canonical(wire.decode(body, mimetype)), repeat)
+        }
+
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('-b', '--blocks', default=100, type=int, help="chain length, defaults to 100")
+    arg_parser.add_argument('-t', '--transactions', default=20, type=int,
+                            help="transactions in each block, defaults to 20")
+    arg_parser.add_argument('-r', '--repeat', default=5, type=int, help="number of repetitions, defaults to 5")
+
+    cl_args = arg_parser.parse_args()
+
+    print(json.dumps(run(cl_args.blocks, cl_args.transactions, cl_args.repeat), indent=2))
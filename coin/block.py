@@ -0,0 +1,331 @@
+"""Compact in-memory representation of blocks and transactions
+
+Blocks and transactions are kept as objects with __slots__ instead of
+dicts. Node ids and public keys are interned so every transaction sent by
+or to the same node shares a single string. Dict views, needed only by
+endpoints, gossip and hashing, are built on demand.
+"""
+
+import sys
+
+from uuid import uuid4
+
+from coin import wire
+from coin.key_pair import KeyPair, fingerprint
+from coin.merkle import merkle_root, leaf_hash, root_from_leaves
+
+signed_keys = ('sender', 'recipient', 'amount', 'id')
+
+
+def work_hash(index, timestamp, previous_hash, merkle_root_hash):
+    """sha-256 digest of block header fields covered by proof of work, all but the proof itself"""
+    return wire.digest({'index': index,
+                        'timestamp': timestamp,
+                        'previous_hash': previous_hash,
+                        'merkle_root': merkle_root_hash})
+
+
+def intern_id(node_id):
+    """intern node id so repeated ids share memory, non str ids are returned as they are"""
+    return sys.intern(node_id) if type(node_id) is str else node_id
+
+
+def signing_data(transaction_dict):
+    """canonical form of transaction fields covered by sender signature"""
+    return wire.canonical({key: transaction_dict[key] for key in signed_keys})
+
+
+class Transaction:
+    """Single transfer of bogo coins
+
+    Transactions are signed by their sender. Sender id is fingerprint of the
+    public key carried by the transaction, so signature can be checked
+    without knowing the sender. Minted coins carry no signature.
+
+    Attributes:
+        sender (str): id of the sending node, "mint" for newly created coins
+        recipient (str): id of the receiving node
+        amount (int): amount of bogo coins
+        id (str): unique transaction id
+        pub_key (str): base64 encoded der public key of the sender, None if unsigned
+        signature (str): base64 encoded signature of the sender, None if unsigned
+    """
+
+    __slots__ = ('sender', 'recipient', 'amount', 'id', 'pub_key', 'signature')
+
+    def __init__(self, sender, recipient, amount, transaction_id=None, pub_key=None, signature=None):
+        self.sender = intern_id(sender)
+        self.recipient = intern_id(recipient)
+        self.amount = amount
+        self.id = transaction_id or str(uuid4())
+        self.pub_key = intern_id(pub_key)
+        self.signature = signature
+
+    @classmethod
+    def from_dict(cls, transaction_dict):
+        """create transaction from its dict view
+
+        Raises:
+            KeyError: when dict misses one of the transaction keys
+            TypeError: when one of the transaction fields has wrong type
+        """
+        transaction = cls(transaction_dict['sender'],
+                          transaction_dict['recipient'],
+                          transaction_dict['amount'],
+                          transaction_dict['id'],
+                          transaction_dict.get('pub_key'),
+                          transaction_dict.get('signature'))
+        transaction.check_fields()
+        return transaction
+
+    def check_fields(self):
+        """check types of transaction fields received from outside
+
+        Fields end up in cache_key and signing data, so they have to be
+        hashable and serializable the same way by every node.
+
+        Raises:
+            TypeError: when one of the fields has wrong type
+        """
+        if not all(type(field) is str for field in (self.sender, self.recipient, self.id)):
+            raise TypeError("Transaction sender, recipient and id have to be strings")
+
+        if type(self.amount) is not int:
+            raise TypeError("Transaction amount has to be an integer")
+
+        if not all(field is None or type(field) is str for field in (self.pub_key, self.signature)):
+            raise TypeError("Transaction public key and signature have to be strings")
+
+    def to_dict(self):
+        """return dict view of the transaction"""
+        return {'sender': self.sender,
+                'recipient': self.recipient,
+                'amount': self.amount,
+                'id': self.id,
+                'pub_key': self.pub_key,
+                'signature': self.signature}
+
+    def sign(self, key_pair):
+        """sign transaction with sender key pair
+
+        Parameters:
+            key_pair (coin.KeyPair): key pair whose fingerprint is the sender id
+        """
+        self.pub_key = intern_id(key_pair.pub_key)
+        self.signature = key_pair.sign(signing_data(self.to_dict()))
+
+    @property
+    def cache_key(self):
+        """tuple of all signed and signing fields identifying verified transaction"""
+        return self.sender, self.recipient, self.amount, self.id, self.pub_key, self.signature
+
+    def valid_signature(self):
+        """check if transaction was signed by its sender, minted coins need no signature"""
+        return valid_signature(self.cache_key)
+
+
+def valid_signature(cache_key):
+    """check signature of transaction given by coin.Transaction.cache_key
+
+    Module level so it can be run in worker processes.
+    """
+    sender, recipient, amount, transaction_id, pub_key, signature = cache_key
+
+    if sender == 'mint':
+        return True
+
+    if pub_key is None or signature is None:
+        return False
+
+    try:
+        if fingerprint(pub_key) != sender:
+            return False
+        data = signing_data({'sender': sender, 'recipient': recipient, 'amount': amount, 'id': transaction_id})
+        return KeyPair.verify(signature, data, pub_key)
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+class Block:
+    """Block of the bogchain
+
+    Block hash covers only the header, transactions are bound to it through
+    merkle root. Proof of work is bound to the header too, through work hash
+    of all header fields but the proof. Hash of a block is calculated once
+    and cached, blocks are not supposed to be modified after being created.
+
+    Attributes:
+        index (int): position of the block in the chain
+        timestamp (float): block creation time
+        transactions (list): list of coin.Transaction
+        proof (int): proof of work
+        previous_hash (str): hash of the previous block
+        merkle_root (str): merkle root of transactions
+    """
+
+    __slots__ = ('index', 'timestamp', 'transactions', 'proof', 'previous_hash', 'merkle_root', '_hash')
+
+    def __init__(self, index, timestamp, transactions, proof, previous_hash, merkle_root_hash=None):
+        """Inits Block
+
+        Parameters:
+            merkle_root_hash (str): merkle root claimed by received block, calculated
+                from transactions if not provided
+        """
+        self.index = index
+        self.timestamp = timestamp
+        self.transactions = transactions
+        self.proof = proof
+        self.previous_hash = previous_hash
+        self.merkle_root = merkle_root_hash or merkle_root(transactions)
+        self._hash = None
+
+    @classmethod
+    def from_dict(cls, block_dict):
+        """create block from its dict view
+
+        Raises:
+            KeyError: when dict misses one of the block or transaction keys
+            TypeError: when transactions are not a list of dicts or their fields have wrong types
+        """
+        return cls(block_dict['index'],
+                   block_dict['timestamp'],
+                   [Transaction.from_dict(transaction) for transaction in block_dict['transactions']],
+                   block_dict['proof'],
+                   block_dict['previous_hash'],
+                   block_dict['merkle_root'])
+
+    @property
+    def header(self):
+        """return dict view of the block header"""
+        return {'index': self.index,
+                'timestamp': self.timestamp,
+                'proof': self.proof,
+                'previous_hash': self.previous_hash,
+                'merkle_root': self.merkle_root}
+
+    def to_dict(self):
+        """return dict view of the block"""
+        return {**self.header, 'transactions': [transaction.to_dict() for transaction in self.transactions]}
+
+    @property
+    def hash(self):
+        """sha-256 digest of the canonical form of the block header"""
+        if self._hash is None:
+            self._hash = wire.digest(self.header)
+        return self._hash
+
+    @property
+    def work_hash(self):
+        """sha-256 digest of header fields covered by proof of work"""
+        return work_hash(self.index, self.timestamp, self.previous_hash, self.merkle_root)
+
+    def valid_merkle_root(self):
+        """check if merkle root matches block transactions
+
+        Odd node of a merkle tree level is paired with itself, so transactions
+        [a, b, c] and [a, b, c, c] have the same root. Blocks repeating a
+        transaction are therefore rejected, otherwise copy of the last
+        transaction could be added to a mined block without changing its hash.
+        """
+        if len({transaction.id for transaction in self.transactions}) != len(self.transactions):
+            return False
+
+        return self.merkle_root == merkle_root(self.transactions)
+
+
+class BlockTemplate:
+    """Block assembled before its proof of work is searched for
+
+    Template is built on top of the last block of the chain and extended as
+    new transactions arrive. Leaf hashes of its transactions are computed
+    once when they are added, header and work hash are rebuilt only when
+    transactions change. Turning template into a block once the proof is
+    found takes no hashing.
+
+    Attributes:
+        index (int): index of the block
+        timestamp (float): block creation time
+        previous_hash (str): hash of the block template is built on
+        transactions (list): list of coin.Transaction
+        leaves (list): leaf hashes of transactions
+        ids (set): ids of transactions in the template
+    """
+
+    __slots__ = ('index', 'timestamp', 'previous_hash', 'transactions', 'leaves', 'ids', '_merkle_root', '_work_hash')
+
+    def __init__(self, index, timestamp, previous_hash, transactions=()):
+        self.index = index
+        self.timestamp = timestamp
+        self.previous_hash = previous_hash
+        self.transactions = []
+        self.leaves = []
+        self.ids = set()
+        self._merkle_root = None
+        self._work_hash = None
+        self.add(transactions)
+
+    def add(self, transactions):
+        """append transactions not yet in the template
+
+        Returns:
+            int: number of added transactions
+        """
+        added = 0
+
+        for transaction in transactions:
+            if transaction.id in self.ids:
+                continue
+
+            self.transactions.append(transaction)
+            self.leaves.append(leaf_hash(transaction))
+            self.ids.add(transaction.id)
+            added += 1
+
+        if added:
+            self._merkle_root = None
+            self._work_hash = None
+
+        return added
+
+    def rebase(self, index, timestamp, previous_hash, included):
+        """move template on top of a new last block dropping transactions the chain already has
+
+        Parameters:
+            index (int): new index of the block
+            timestamp (float): new block creation time
+            previous_hash (str): hash of the new last block
+            included (callable): function returning True for ids of transactions already in the chain,
+                e.g. Bogchain.in_chain
+        """
+        kept = [i for i, transaction in enumerate(self.transactions) if not included(transaction.id)]
+
+        self.transactions = [self.transactions[i] for i in kept]
+        self.leaves = [self.leaves[i] for i in kept]
+        self.ids = {transaction.id for transaction in self.transactions}
+        self.index = index
+        self.timestamp = timestamp
+        self.previous_hash = previous_hash
+        self._merkle_root = None
+        self._work_hash = None
+
+    @property
+    def merkle_root(self):
+        if self._merkle_root is None:
+            self._merkle_root = root_from_leaves(self.leaves)
+        return self._merkle_root
+
+    @property
+    def work_hash(self):
+        """sha-256 digest of header fields proof of work has to be found for"""
+        if self._work_hash is None:
+            self._work_hash = work_hash(self.index, self.timestamp, self.previous_hash, self.merkle_root)
+        return self._work_hash
+
+    def block(self, proof):
+        """turn template into a block with found proof of work
+
+        Returns:
+            coin.Block: block sharing transactions and merkle root with the template
+        """
+        return Block(self.index, self.timestamp, self.transactions, proof, self.previous_hash, self.merkle_root)
@@ -1,12 +1,15 @@
-import json
 import hashlib
 import asyncio
 import threading
 import time
 
-from uuid import uuid4
-
 from coin.peers import Peers
+from coin.clock import Clock
+from coin.block import Block, BlockTemplate, Transaction
+from coin.merkle import merkle_path
+from coin.snapshot import Snapshot, archive_blocks
+from coin.events import EventHub
+from coin import metrics, profiling
 
 
 class Bogchain:
@@ -15,10 +18,17 @@ class Bogchain:
     Attributes:
         node_id (str): unique app id
         gossip (coin.Gossip): object responsible for sending updates to app peers
-        chain (list): Blockchain, list of blocks represented as dicts
+        chain (list): Blockchain, list of coin.Block following the snapshot
+        snapshot (coin.Snapshot): checkpoint of blocks pruned from the chain
+        prune_depth (int): number of newest blocks kept in memory, older blocks are folded
+            into the snapshot, None keeps whole chain
+        archive_path (str): path of file pruned blocks are appended to, None drops them
+        transaction_index (dict): dict mapping ids of transactions in the chain
+            to indexes of blocks containing them
         peers (coin.Peers): Object containing app peers
-        awaiting_transactions (list): list of transaction dicts waiting to be mined into a new block
-        new_block_transactions (list): list of transactions that are being mined into a new block
+        awaiting_transactions (list): list of coin.Transaction waiting to be added to block template
+        template (coin.BlockTemplate): block assembled for the next mining round, None until
+            transactions arrive
         wake_transaction_handler (threading.Event()): event object responsible for waking transaction loop
             when new transaction was received
         mining_task (asyncio.Task): asyncio task handling mining of a new block
@@ -32,6 +42,13 @@ class Bogchain:
         difficulty (int): number of leading zeroes for computing block proof of work
         mining_bounty (int): amount of bogo coins received for completing block
         founder_bounty (int): amount of bogo coins received for founding blockchain
+        clock (coin.Clock): source of time and randomness
+        verifier (coin.TransactionVerifier): verifier of transaction signatures, None if
+            signatures are not checked
+        events (coin.EventHub): hub passing new blocks, reorgs and accepted transactions
+            to subscribers
+        lock (threading.RLock): guards the chain, template and awaiting transactions, mining
+            loop commits blocks while flask threads add transactions and replace the chain
 
     """
 
@@ -46,152 +63,427 @@ class Bogchain:
             node_id (str): unique app id
             gossip (coin.Gossip): object responsible for sending updates to app peers
             logger (Flask.app.logger): flask app logger for debug
+            peers (coin.Peers): app peers shared with gossip, new coin.Peers is created if not provided
+            clock (coin.Clock): source of time, coin.SimulatedClock in simulations, real time clock
+                is used if not provided
+            verifier (coin.TransactionVerifier): verifier of transaction signatures, signatures
+                are not checked if not provided
+            prune_depth (int): number of newest blocks kept in memory, whole chain is kept if not provided
+            archive_path (str): path of file pruned blocks are appended to
+            events (coin.EventHub): hub events are published to, new coin.EventHub is created if not provided
         """
         self.node_id = kwargs['node_id']
         self.gossip = kwargs['gossip']
         self.chain = []
-        self.peers = Peers()
+        self.snapshot = Snapshot()
+        self.prune_depth = kwargs.get('prune_depth')
+        self.archive_path = kwargs.get('archive_path')
+        self.transaction_index = {}
+        self.peers = kwargs['peers'] if kwargs.get('peers') is not None else Peers()
         self.awaiting_transactions = []
-        self.new_block_transactions = []
+        self.template = None
         self.wake_transaction_handler = threading.Event()
         self.mining_task = None
         self.throttle = None
         self.logger = kwargs['logger']
         self.recently_updated = False
         self.evil = False
+        self.clock = kwargs['clock'] if kwargs.get('clock') is not None else Clock()
+        self.verifier = kwargs.get('verifier')
+        self.events = kwargs['events'] if kwargs.get('events') is not None else EventHub()
+        self.lock = threading.RLock()
 
-    def new_block(self, proof, previous_hash=None):
-        """create new block dict and append it to the blockchain
+    def append_block(self, block):
+        """append block to the blockchain, index its transactions and prune old blocks
 
         Parameters:
-            proof (int): proof of work
-            previous_hash (str): hash of a previous block
+            block (coin.Block): block following the last block
 
         Returns:
-            dict: new block
+            coin.Block: appended block
         """
-        block = {
-            'index': len(self.chain),
-            'timestamp': time.time(),
-            'transactions': self.new_block_transactions,
-            'proof': proof,
-            'previous_hash': previous_hash or self.hash(self.chain[-1])
-        }
-        self.new_block_transactions = []
+        with self.lock:
+            self.chain.append(block)
+            self.index_block(block)
+            self.prune()
+            self.events.publish('block', map(Block.to_dict, [block]))
+            return block
 
-        self.chain.append(block)
-        return block
+    def add_transactions(self, transactions):
+        """queue accepted transactions for mining, publish them and wake transaction handler
 
-    def create_genesis_block(self):
-        """create the first block and transfer set amount of coins to founder
+        Parameters:
+            transactions (list): list of coin.Transaction
+        """
+        with self.lock:
+            self.awaiting_transactions.extend(transactions)
+
+        self.events.publish('transaction', map(Transaction.to_dict, transactions))
+
+        if not self.wake_transaction_handler.is_set():
+            self.wake_transaction_handler.set()
+
+    def receive_transactions(self, transaction_dicts):
+        """queue transactions sent by peers, body of transaction processing routes
+
+        Forging node ignores them. Minting transactions are refused, coins
+        are minted only by blocks.
+
+        Parameters:
+            transaction_dicts (list): dict views of received transactions
+
+        Returns:
+            tuple: error message and status code, None if transactions were accepted
+        """
+        if self.evil:
+            return None
+
+        try:
+            transactions = [Transaction.from_dict(transaction) for transaction in transaction_dicts]
+        except TypeError as e:
+            return str(e), 400
+
+        if any(transaction.sender == 'mint' for transaction in transactions):
+            return "Minted coins can only be created by blocks", 403
+
+        # verified transactions are cached and not verified again when they arrive in a block
+        if self.verifier is not None and not self.verifier.verify(transactions):
+            return "Invalid transaction signature", 403
+
+        self.add_transactions(transactions)
+        return None
+
+    def new_transactions(self, transaction_dicts, key_pair=None):
+        """create transactions sent by the app, body of new transaction routes
+
+        Parameters:
+            transaction_dicts (list): dicts containing recipient and amount of each transaction
+            key_pair (coin.KeyPair): app key pair transactions are signed with, unsigned if not provided
+
+        Returns:
+            list: list of coin.Transaction
+
+        Raises:
+            TypeError: when recipient or amount has wrong type
+        """
+        transactions = [self.create_transaction(self.node_id, transaction['recipient'], transaction['amount'])
+                        for transaction in transaction_dicts]
+
+        for transaction in transactions:
+            transaction.check_fields()
+
+        if key_pair is not None:
+            for transaction in transactions:
+                transaction.sign(key_pair)
+
+        return transactions
+
+    def in_chain(self, transaction_id):
+        """check if transaction is in the chain, including pruned blocks"""
+        return transaction_id in self.transaction_index or transaction_id in self.snapshot.transaction_ids
+
+    def index_block(self, block):
+        """add block transactions to transaction index"""
+        for transaction in block.transactions:
+            self.transaction_index[transaction.id] = block.index
+
+    def replace_chain(self, new_chain):
+        """replace blockchain and rebuild transaction index
+
+        Parameters:
+            new_chain (list): list of coin.Block following the snapshot
+        """
+        with self.lock:
+            self.chain = new_chain
+            self.transaction_index = {}
+
+            for block in new_chain:
+                self.index_block(block)
+
+            self.prune()
+
+    @property
+    def height(self):
+        """number of blocks in the chain including pruned ones"""
+        return self.snapshot.height + len(self.chain)
+
+    def prune(self):
+        """fold blocks older than prune depth into the snapshot and archive them"""
+        if self.prune_depth is None or len(self.chain) <= self.prune_depth:
+            return
+
+        pruned = self.chain[:-self.prune_depth]
+
+        # snapshot is copied and replaced before the chain is trimmed, readers taking the chain
+        # before the snapshot never miss blocks, at worst they see blocks already in the snapshot
+        snapshot = self.snapshot.copy()
+        snapshot.apply(pruned)
+        self.snapshot = snapshot
+        self.chain = self.chain[-self.prune_depth:]
+
+        for block in pruned:
+            for transaction in block.transactions:
+                self.transaction_index.pop(transaction.id, None)
+
+        if self.archive_path is not None:
+            archive_blocks(self.archive_path, pruned)
+
+        metrics.pruned_blocks.inc(len(pruned))
+
+    def load_snapshot(self, snapshot, new_chain):
+        """start from trusted snapshot and blocks following it
+
+        Parameters:
+            snapshot (coin.Snapshot): trusted snapshot
+            new_chain (list): list of block dicts following the snapshot
 
         Returns:
-            dict: genesis_block
+            bool: True if blocks are valid continuation of the snapshot
         """
-        self.new_block_transactions.append(Bogchain.create_transaction("mint", self.node_id, Bogchain.founder_bounty))
+        try:
+            new_chain = [Block.from_dict(block) for block in new_chain]
+        except (KeyError, TypeError):
+            return False
+
+        if not self.consecutive(new_chain, snapshot.height):
+            return False
+
+        if not self.valid_chain(new_chain, snapshot.last_hash):
+            return False
+
+        with self.lock:
+            self.snapshot = snapshot
+            self.replace_chain(new_chain)
+
+        return True
+
+    def hash_at(self, index):
+        """hash of the block at given index, None if chain is not that long"""
+        if index < self.snapshot.height:
+            return self.snapshot.headers[index]
 
-        return self.new_block(100, "gen")
+        position = index - self.snapshot.height
+
+        return self.chain[position].hash if position < len(self.chain) else None
 
     @staticmethod
-    def create_transaction(sender, recipient, amount):
-        """create transaction dict"""
-        transaction_dict = {'sender': sender,
-                            'recipient': recipient,
-                            'amount': amount,
-                            'id': str(uuid4())}
+    def consecutive(chain, start):
+        """check if block indexes follow each other starting from start"""
+        return all(block.index == start + i for i, block in enumerate(chain))
+
+    def transaction_proof(self, transaction_id):
+        """find transaction in the chain and prove its inclusion
+
+        Parameters:
+            transaction_id (str): id of a transaction
 
-        return transaction_dict
+        Returns:
+            dict: transaction, header of the block containing it and merkle path
+                from transaction to block merkle root, None if transaction is not in the chain
+        """
+        # index, chain and snapshot are read together, pruning or replacing the chain in between
+        # would point to a wrong block
+        with self.lock:
+            block_index = self.transaction_index.get(transaction_id)
+
+            if block_index is None:
+                return None
+
+            block = self.chain[block_index - self.snapshot.height]
+
+        position = next(i for i, transaction in enumerate(block.transactions) if transaction.id == transaction_id)
+
+        return {
+            'transaction': block.transactions[position].to_dict(),
+            'block_hash': block.hash,
+            'header': block.header,
+            'path': merkle_path(block.transactions, position)
+        }
+
+    def create_genesis_block(self):
+        """create the first block and transfer set amount of coins to founder
+
+        Returns:
+            coin.Block: genesis_block
+        """
+        genesis_transactions = [self.create_transaction("mint", self.node_id, Bogchain.founder_bounty)]
+
+        return self.append_block(Block(0, self.clock.time(), genesis_transactions, 100, "gen"))
+
+    def create_transaction(self, sender, recipient, amount):
+        """create transaction with new unique id"""
+        return Transaction(sender, recipient, amount, str(self.clock.uuid()))
 
     @staticmethod
     def hash(block):
         """calculate hash of a block
 
         Parameters:
-            block (dict)
+            block (coin.Block)
 
         Returns:
             str: sha-256 digest of a block
         """
-        block_string = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return block.hash
 
     @property
     def last_block(self):
         """return lst block from blockchain"""
         return self.chain[-1]
 
+    def balance(self, node_id):
+        """amount of bogo coins owned by node, counting pruned blocks through the snapshot"""
+        chain = self.chain
+        snapshot = self.snapshot
+        bogs = snapshot.balances.get(node_id, 0)
+
+        for block in chain:
+            if block.index < snapshot.height:
+                continue
+
+            for transaction in block.transactions:
+                if transaction.sender == node_id:
+                    bogs -= transaction.amount
+                elif transaction.recipient == node_id:
+                    bogs += transaction.amount
+
+        return bogs
+
+    @property
+    def pending_transactions(self):
+        """number of transactions waiting to be mined, coinbase of the template is not counted"""
+        template = self.template
+        return len(self.awaiting_transactions) + (len(template.transactions) - 1 if template is not None else 0)
+
+    @property
+    def snapshot_state(self):
+        """get dict containing snapshot, its hash and dict view of blocks following it"""
+        chain = self.chain
+        snapshot = self.snapshot
+
+        return {
+            'snapshot': snapshot.to_dict(),
+            'hash': snapshot.hash,
+            'chain': [block.to_dict() for block in chain if block.index >= snapshot.height]
+        }
+
     @property
     def current_state(self):
-        """get dict containing blockchain and peers"""
+        """get dict containing dict view of blockchain following the snapshot and peers"""
         return {
-            'chain': self.chain,
-            'peers': self.peers.addresses_pub_keys
+            'chain': [block.to_dict() for block in self.chain],
+            'peers': self.peers.sample()
                 }
 
-    def proof_of_work(self, last_proof):
+    def proof_of_work(self, work_hash):
         """calculate proof of work using hashcash like algorithm
 
         Increase proof value by one in each iteration until resulting
         proof of work is valid
 
         Parameters:
-            last_proof (int): proof of previous block
+            work_hash (str): work hash of the block template
 
         Returns:
             int: proof of work
         """
         proof = 0
-        while self.valid_proof(last_proof, proof) is False:
+        while self.valid_proof(work_hash, proof) is False:
             proof += 1
 
+        metrics.hashes.inc(proof + 1)
         return proof
 
     @staticmethod
-    def valid_proof(last_proof, proof):
+    def valid_proof(work_hash, proof):
         """Check if proof od work is valid
 
         Proof of work used is similar to hashcash. Valid if sha-256 of
-        last_proof concatenated with new proof has 4 leading zeroes.
+        block work hash concatenated with proof ends with difficulty zeroes,
+        so proof can't be reused for a block with different contents.
 
         Parameters:
-            last_proof (int): previous block proof of work
+            work_hash (str): work hash of the block, see coin.Block.work_hash
             proof (int): proof of work to be verified
 
         Returns:
             bool: True if proof is valid
         """
-        return hashlib.sha256(f'{last_proof}{proof}'.encode()).hexdigest()[-Bogchain.difficulty:] == Bogchain.difficulty * '0'
+        return hashlib.sha256(f'{work_hash}{proof}'.encode()).hexdigest()[-Bogchain.difficulty:] == Bogchain.difficulty * '0'
 
-    def valid_chain(self, chain):
+    def valid_chain(self, chain, previous_hash=None):
         """Check if blockchain is valid
 
-        Iterate over blockchain validating hashes of previous blocks.
-        Chains with single block are assumed to be genesis blocks and
-        are valid by default.
+        Iterate over blockchain validating merkle roots, minted coins, unique
+        transaction ids, hashes of previous blocks and proofs of work of block
+        headers. Genesis block
+        carries no proof of work and is valid by default as long as merkle root
+        matches its transactions. Transaction signatures are checked last, as
+        they are the most expensive.
 
         Parameters:
-            chain (dict): blockchain to be validated
+            chain (list): blockchain to be validated, list of coin.Block
+            previous_hash (str): hash of already trusted block preceding the chain,
+                None if chain starts with genesis block
 
         Returns:
             bool: True if valid chain
         """
 
-        # todo check if genesis block or duplicate genesis block.
-        if len(chain) == 1:
-            return True
+        if not all(block.valid_merkle_root() for block in chain):
+            return False
+
+        if not all(self.valid_mint(block) for block in chain):
+            return False
+
+        # signed transfer may be included only once, otherwise miner could replay its signature
+        transaction_ids = [transaction.id for block in chain for transaction in block.transactions]
+
+        if len(set(transaction_ids)) != len(transaction_ids):
+            return False
 
+        if previous_hash is not None and chain and chain[0].previous_hash != previous_hash:
+            return False
+
+        # todo check if genesis block or duplicate genesis block.
         for i in range(1, len(chain)):
             block = chain[i]
             prev_block = chain[i - 1]
 
-            if block['previous_hash'] != self.hash(prev_block):
+            if block.previous_hash != self.hash(prev_block):
                 return False
 
-            if self.valid_proof(prev_block['proof'], block['proof']) is False:
+        for block in chain:
+            if block.index != 0 and self.valid_proof(block.work_hash, block.proof) is False:
                 return False
 
+        if self.verifier is not None:
+            return self.verifier.verify(transaction for block in chain for transaction in block.transactions)
+
         return True
 
+    @staticmethod
+    def valid_mint(block):
+        """check coins minted by block
+
+        Minting transactions carry no signature, so block may mint coins only
+        once, in its first transaction and for exactly the bounty of its miner,
+        founder bounty in genesis block.
+
+        Parameters:
+            block (coin.Block): block to be checked
+
+        Returns:
+            bool: True if block mints no coins or only its bounty
+        """
+        mints = [i for i, transaction in enumerate(block.transactions) if transaction.sender == 'mint']
+
+        if not mints:
+            return True
+
+        bounty = Bogchain.founder_bounty if block.index == 0 else Bogchain.mining_bounty
+        return mints == [0] and block.transactions[0].amount == bounty
+
     def run_transaction_handler(self, accumulation_period):
         """Run transaction handler using asyncio
 
@@ -204,9 +496,12 @@ class Bogchain:
         """Loop handling incoming transaction
 
         App waits for a new transaction to process, then begins specified
-        wait time until mining begins. Mining will be interrupted if app receives
-        blockchain update with longer chain. Otherwise update with new chain will be sent
-        to all peers.
+        wait time until mining begins. Block template is refreshed with
+        transactions received in the meantime and its proof of work is
+        searched for. Mining will be interrupted if app receives blockchain
+        update with longer chain. Otherwise update with new chain will be sent
+        to all peers. Transactions of interrupted round stay in the template
+        and are mined on top of the new chain.
 
         Parameters:
             accumulation_period (float): time until transactions will be mined into new block
@@ -220,44 +515,110 @@ class Bogchain:
             self.logger.info(f"New transactions sleep ends")
             self.recently_updated = False
 
-            await asyncio.sleep(accumulation_period)
+            await self.clock.async_sleep(accumulation_period)
             self.wake_transaction_handler.clear()
 
-            self.new_block_transactions = self.awaiting_transactions[:]
-            self.awaiting_transactions = []
-            self.mining_task = asyncio.create_task(self.mine())
+            template = None if self.recently_updated else self.begin_mining_round()
+
+            if template is not None:
+                self.logger.info(f"Beginning of mining {len(template.transactions) - 1} transactions to be mined")
+                self.mining_task = asyncio.create_task(self.mine(template))
 
-            try:
-                if not self.recently_updated:
-                    self.logger.info(f"Beginning of mining {len(self.new_block_transactions)} transactions to be mined")
+                try:
                     proof = await self.mining_task
-                    self.new_block_transactions.append(
-                        Bogchain.create_transaction("mint", self.node_id, Bogchain.mining_bounty)
-                    )
-                    self.new_block(proof)
-                    self.logger.info(f"Mined new block, chain length {len(self.chain)}")
-                    self.gossip.flood('/update', self.current_state, self.peers.addresses)
-
-            except asyncio.CancelledError:
+                    self.commit_mined_block(template, proof)
+                except asyncio.CancelledError:
+                    self.logger.info(f"Mining cancelled")
+
                 self.mining_task = None
 
-                received_block_transactions_ids = [transaction['id'] for transaction in self.last_block['transactions']]
+            # transactions of skipped, cancelled or stale round are mined in the next one
+            if self.pending_transactions and not self.wake_transaction_handler.is_set():
+                self.wake_transaction_handler.set()
 
-                for transaction in self.new_block_transactions:
-                    if transaction['id'] not in received_block_transactions_ids:
-                        self.awaiting_transactions.append(transaction)
-                        self.logger.info("Leftover new transaction back to awaiting transactions")
-                        self.wake_transaction_handler.set()
-                self.logger.info(f"Mining cancelled")
+    def refresh_template(self):
+        """bring block template up to date with the chain and awaiting transactions
+
+        New template starts with coinbase transaction paying mining bounty.
+        When the chain changed template is moved on top of its last block and
+        transactions already in the chain are dropped. Awaiting transactions
+        not in the chain are then appended, only their leaf hashes are computed.
+
+        Returns:
+            coin.BlockTemplate: refreshed template
+        """
+        with self.lock:
+            last_hash = self.last_block.hash
+            template = self.template
+
+            if template is None:
+                coinbase = self.create_transaction("mint", self.node_id, Bogchain.mining_bounty)
+                template = BlockTemplate(self.height, self.clock.time(), last_hash, [coinbase])
+            elif template.previous_hash != last_hash:
+                template.rebase(self.height, self.clock.time(), last_hash, self.in_chain)
+
+            transactions, self.awaiting_transactions = self.awaiting_transactions, []
+            template.add(transaction for transaction in transactions
+                         if transaction.sender != 'mint' and not self.in_chain(transaction.id))
+
+            self.template = template
+            return template
+
+    def begin_mining_round(self):
+        """refresh block template for the mining round
+
+        Returns:
+            coin.BlockTemplate: template to be mined, None if it has no transactions besides coinbase
+        """
+        template = self.refresh_template()
+        return template if len(template.transactions) > 1 else None
+
+    def commit_mined_block(self, template, proof):
+        """turn mined template into a block, append it to the chain and send update to peers
+
+        Block is assembled before mining, so committing it takes no hashing.
+        Template is not committed if the chain changed while proof was searched
+        for, its transactions are mined on top of the new chain in the next round.
+        Staleness check and append hold the chain lock, so chain received by
+        flask thread can't replace the chain in between.
+
+        Parameters:
+            template (coin.BlockTemplate): mined template
+            proof (int): proof of work found for the template
 
-    async def mine(self):
-        """asyncio task performing proof of work calculation"""
+        Returns:
+            coin.Block: appended block, None if template was stale
+        """
+        with self.lock:
+            if template is not self.template or template.previous_hash != self.last_block.hash:
+                self.logger.info("Chain changed during mining, mined block dropped")
+                return None
+
+            block = self.append_block(template.block(proof))
+            self.template = None
+
+        metrics.blocks_mined.inc()
+        self.logger.info(f"Mined new block, chain length {self.height}")
+        self.gossip.flood('/update', self.current_state, self.peers.addresses)
+        return block
+
+    async def mine(self, template):
+        """asyncio task performing proof of work calculation
+
+        Parameters:
+            template (coin.BlockTemplate): template proof of work is searched for
+        """
         start_time = time.time()
         if self.throttle is not None:
-            await asyncio.sleep(self.throttle)
+            await self.clock.async_sleep(self.throttle)
 
-        last_proof = self.last_block['proof']
-        proof = self.proof_of_work(last_proof)
+        pow_start_time = time.perf_counter()
+        with profiling.profiler.section('mining'):
+            proof = self.proof_of_work(template.work_hash)
+        pow_time = time.perf_counter() - pow_start_time
+
+        metrics.hash_rate.set(round((proof + 1) / pow_time) if pow_time > 0 else 0)
+        metrics.mining_duration.observe(time.time() - start_time)
 
         time_elapsed = round((time.time() - start_time) * 1e3)
         self.logger.info(f"Finished mining proof: {proof}, time elapsed: {time_elapsed} ms")
@@ -268,50 +629,212 @@ class Bogchain:
 
         New chain is accepted if block hashes are valid and its longer
         than current chain. In case two chains are of the same lengths
-        the one with older last block is chosen as valid.
+        the one with older last block is chosen as valid. Received chain
+        may start after pruned blocks of the sender, then it has to continue
+        local chain, blocks below local snapshot have to match it. Processing
+        time, block propagation latency and reorgs are recorded in metrics.
+        Chain is compared and replaced under the chain lock, so concurrent
+        updates and mined blocks are applied one at a time.
 
         Parameters:
-             new_chain (dict): Chain received from peer
+             new_chain (list): Chain received from peer, list of block dicts
 
         Returns:
             bool: True if chain replaced
         """
+        with metrics.update_chain_duration.time(), self.lock:
+            return self._update_chain(new_chain)
+
+    def _update_chain(self, new_chain):
         replaced = False
 
-        if not self.valid_chain(new_chain):
+        try:
+            new_chain = [Block.from_dict(block) for block in new_chain]
+        except (KeyError, TypeError):
+            self.logger.info("Malformed received chain")
+            return replaced
+
+        if not new_chain:
+            return replaced
+
+        start = new_chain[0].index
+
+        if not isinstance(start, int) or start < 0 or not self.consecutive(new_chain, start):
+            self.logger.info("Malformed received chain")
+            return replaced
+
+        # chain of a pruning peer starts after its snapshot, it has to continue local chain
+        if start > 0 and self.hash_at(start - 1) != new_chain[0].previous_hash:
+            self.logger.info("Received chain doesn't connect to local chain")
+            return replaced
+
+        base = self.snapshot.height
+
+        if any(block.hash != self.snapshot.headers[block.index] for block in new_chain if block.index < base):
+            self.logger.info("Received chain conflicts with snapshot")
+            return replaced
+
+        new_blocks = [block for block in new_chain if block.index >= base]
+
+        if not new_blocks:
+            return replaced
+
+        first = new_blocks[0].index
+
+        # blocks below first are kept, their transactions can't appear again in the new blocks
+        if any(transaction.id in self.snapshot.transaction_ids
+               or self.transaction_index.get(transaction.id, first) < first
+               for block in new_blocks for transaction in block.transactions):
+            self.logger.info("Received chain repeats transactions of kept blocks")
+            return replaced
+        new_height = first + len(new_blocks)
+
+        with metrics.valid_chain_duration.time():
+            valid = self.valid_chain(new_blocks, self.hash_at(first - 1) if first > 0 else None)
+
+        if not valid:
             self.logger.info("Invalid received chain")
             return replaced
 
-        elif len(self.chain) == len(new_chain):
-            if new_chain[-1]['timestamp'] < self.chain[-1]['timestamp']:
+        elif new_height == self.height:
+            if self.chain and new_blocks[-1].timestamp < self.last_block.timestamp:
                 self.logger.info("Choosing older chain")
                 replaced = True
 
-        elif len(new_chain) > len(self.chain):
+        elif new_height > self.height:
             self.logger.info("Choosing longer chain")
             replaced = True
 
         if replaced:
-            self.chain = new_chain
+            metrics.chain_replacements.inc()
+            metrics.block_propagation.observe(max(self.clock.time() - new_blocks[-1].timestamp, 0))
+
+            # first block the new chain doesn't share with the local one
+            fork = next((block.index for block in new_blocks if self.hash_at(block.index) != block.hash), new_height)
+            previous_height = self.height
+            previous_hash = self.last_block.hash if self.chain else None
+
+            if fork < previous_height:
+                metrics.reorgs.inc()
+
+            self.replace_chain(self.chain[:first - base] + new_blocks)
             self.recently_updated = True
 
+            if fork < previous_height:
+                self.events.publish('reorg', [{'fork_index': fork,
+                                               'dropped_blocks': previous_height - fork,
+                                               'previous_hash': previous_hash,
+                                               'new_hash': new_blocks[-1].hash}])
+
+            self.events.publish('block', (block.to_dict() for block in new_blocks if block.index >= fork))
+
         return replaced
 
+    def relay_chain(self, excluded=None):
+        """forward accepted chain to peers in the background
+
+        With bounded peer tables miner reaches only its own peers, the chain
+        spreads further hop by hop. Peers that already have it don't accept it
+        again, so it is not forwarded twice.
+
+        Parameters:
+            excluded (list): addresses of peers chain is not sent to, e.g. its sender
+        """
+        self.clock.call_later(0, self.gossip.flood, '/update', self.current_state, self.peers.addresses, excluded)
+
+    def receive_update(self, update_json, origin_id):
+        """apply update sent by peer, body of update route
+
+        Accepted chain is forwarded to other peers, peers of the update are
+        added while app looks for more.
+
+        Parameters:
+            update_json (dict): dict containing chain and sample of peers of the sender
+            origin_id (str): id of the sender
+
+        Returns:
+            dict: response body with addresses of new peers and whether chain was replaced
+        """
+        updated = self.update_chain(update_json['chain'])
+
+        if updated:
+            self.relay_chain([self.peers.get_address(origin_id)])
+
+        new_peers = self.update_peers(update_json['peers'])
+
+        return {'new_peers': new_peers, 'updated': updated}
+
+    def register_peer(self, node, respond=True):
+        """register peer that introduced itself, body of registration route
+
+        Full peer table is answered with a sample of peers new peer can join
+        through. Unless peer registers in response to app registration, app
+        registers with it in turn, sends it app state and floods old peers.
+
+        Parameters:
+            node (dict): dict containing address, node_id and pub_key of the peer
+            respond (bool): register with new peer and send it app state
+
+        Returns:
+            tuple: response body and status code
+        """
+        if not self.well_formed_peer(node['node_id'], node):
+            return {'message': "Node id, address and public key have to be strings"}, 400
+
+        if not self.peers.valid_id(node['node_id'], node['pub_key']):
+            return {'message': "Node id is not fingerprint of its public key"}, 400
+
+        if node['node_id'] not in self.peers and self.peers.full and not self.peers.evict_unavailable():
+            # new node can still join through peers sampled from the table
+            return {'message': "Peer table full", 'peers': self.peers.sample()}, 503
+
+        if not self.peers.add_peer(node['address'], node['node_id'], node['pub_key']):
+            message = f"Node {node['node_id']} already exists"
+            self.logger.debug(message)
+            return {'message': message}, 409
+
+        self.logger.debug(f"Registered new node {node['node_id']}")
+
+        if respond and self.gossip.register_response(node['address'], self.current_state):
+            self.gossip.flood("/update", self.current_state, self.peers.addresses, [node['address']])
+
+        return {'message': 'Node added', 'new_node': node}, 201
+
     def update_peers(self, received_peers):
-        """Add new peers from peer update
+        """Add new peers from peer update until app has enough of them
+
+        App introduces itself to every added peer in the background, so the
+        update is answered without waiting for them. Peers that don't accept
+        it are removed again so both sides of every connection know each other.
 
         Parameters:
-            received_peers (dict): dict containing peers from update
+            received_peers (dict): dict containing sample of peers of the sender
 
         Returns:
-            list: list of new peers added
+            list: list of addresses of new peers, app introduction to them may be still pending
         """
         new_peers = []
 
+        if not isinstance(received_peers, dict):
+            self.logger.info("Malformed peers of received update")
+            return new_peers
+
         for key, value in received_peers.items():
-            if key not in [*self.peers.addresses_pub_keys.keys(), self.node_id]:
-                self.peers.add_peer(value['address'], key, value['pub_key'])
-                new_peers.append(value['address'])
+            if not self.peers.wanted:
+                break
+
+            if not self.well_formed_peer(key, value):
+                self.logger.info("Malformed peer of received update skipped")
+                continue
+
+            if key == self.node_id or key in self.peers:
+                continue
+
+            if not self.peers.add_peer(value['address'], key, value['pub_key']):
+                continue
+
+            self.clock.call_later(0, self.introduce_to_peer, key, value['address'])
+            new_peers.append(value['address'])
 
         new_peers_number = len(new_peers)
 
@@ -319,3 +842,14 @@ class Bogchain:
             self.logger.info(f"Updated peers, number of new peers {len(new_peers)}")
 
         return new_peers
+
+    @staticmethod
+    def well_formed_peer(node_id, node):
+        """check that peer entry has str id and dict with str address and public key"""
+        return (type(node_id) is str and isinstance(node, dict)
+                and type(node.get('address')) is str and type(node.get('pub_key')) is str)
+
+    def introduce_to_peer(self, node_id, address):
+        """register app with peer added from peer update, remove the peer if it doesn't accept app"""
+        if not self.gossip.introduce(address):
+            self.peers.remove_peer(node_id)
@@ -0,0 +1,48 @@
+"""Checks of incoming requests shared by app routes and simulated nodes
+
+Flask routes of app.py apply them through decorators, coin.simulation
+runs them before dispatching requests delivered by simulated network, so
+both reject malformed and unsigned requests the same way.
+
+Every check returns error message and status code of the response, or
+None when request passes.
+"""
+
+from coin import wire
+from coin.key_pair import KeyPair
+
+
+def check_keys(payload, required):
+    """check that payload is a dict containing required keys"""
+    if not isinstance(payload, dict):
+        return "Unsupported or malformed body", 400
+    if not all(key in payload for key in required):
+        return "Missing required values", 400
+    return None
+
+
+def check_batch_keys(transactions, required):
+    """check that transactions of a batch are dicts containing required keys"""
+    if not isinstance(transactions, list) or not all(isinstance(transaction, dict)
+                                                     for transaction in transactions):
+        return "Transactions have to be a list", 400
+    if not all(key in transaction for transaction in transactions for key in required):
+        return "Missing required values", 400
+    return None
+
+
+def check_signature(signature, payload, pub_key):
+    """check signature of canonical form of request payload
+
+    Parameters:
+        signature (str): base64 encoded signature from request headers
+        payload (dict): decoded request body
+        pub_key (str): public key of the signer, None if signer is not known
+    """
+    if not signature:
+        return "Invalid request", 400
+    if pub_key is None:
+        return "Node not registered", 403
+    if not KeyPair.verify(signature, wire.canonical(payload), pub_key):
+        return "Invalid signature", 403
+    return None
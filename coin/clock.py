@@ -0,0 +1,149 @@
+"""Clocks used by Bogchain, Gossip and TestScheduler
+
+Clock reads real time. SimulatedClock keeps virtual time that is advanced
+by discrete event scheduler: events are run in order of their time and
+time jumps straight to the next event, so simulated scenarios run as fast
+as their events can be processed. Ties are broken by order in which events
+were scheduled and all randomness comes from seeded generator, which makes
+simulation runs with the same seed identical.
+"""
+
+import asyncio
+import heapq
+import random
+import threading
+import time
+
+from uuid import UUID, uuid4
+
+
+class Clock:
+    """Real time clock
+
+    Attributes:
+        random (random.Random): source of randomness
+    """
+
+    def __init__(self):
+        self.random = random.Random()
+
+    def time(self):
+        """return unix time in seconds"""
+        return time.time()
+
+    def monotonic(self):
+        """return monotonic time in seconds for measuring durations"""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def uuid(self):
+        """return new random uuid"""
+        return uuid4()
+
+    def call_later(self, delay, callback, *args):
+        """call callback in a separate thread after delay in seconds
+
+        Returns:
+            threading.Timer: handle that can be passed to cancel
+        """
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    @staticmethod
+    def cancel(event):
+        """prevent scheduled call from running"""
+        event.cancel()
+
+
+class SimulatedClock(Clock):
+    """Virtual time clock with discrete event scheduler
+
+    Attributes:
+        now (float): current virtual time in seconds
+        random (random.Random): seeded source of randomness
+        events (list): heap of scheduled events
+    """
+
+    def __init__(self, seed=0, start=0.0):
+        """Inits SimulatedClock
+
+        Parameters:
+            seed (int): seed of the random generator
+            start (float): initial virtual time
+        """
+        super().__init__()
+        self.now = start
+        self.random = random.Random(seed)
+        self.events = []
+        self.sequence = 0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """advance virtual time running all events due in the meantime"""
+        self.run(until=self.now + seconds)
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+
+    def uuid(self):
+        """return uuid drawn from seeded generator"""
+        return UUID(int=self.random.getrandbits(128), version=4)
+
+    def call_at(self, when, callback, *args):
+        """schedule callback to be called at virtual time
+
+        Parameters:
+            when (float): virtual time of the call, past times are run at current time
+            callback (callable): function to be called
+            args: callback arguments
+
+        Returns:
+            list: event handle that can be passed to cancel
+        """
+        event = [max(when, self.now), self.sequence, callback, args]
+        self.sequence += 1
+        heapq.heappush(self.events, event)
+        return event
+
+    def call_later(self, delay, callback, *args):
+        """schedule callback to be called after delay in virtual seconds"""
+        return self.call_at(self.now + delay, callback, *args)
+
+    @staticmethod
+    def cancel(event):
+        """prevent scheduled event from running"""
+        event[2] = None
+
+    def run(self, until=None):
+        """run scheduled events in order of their time
+
+        Parameters:
+            until (float): virtual time at which to stop, run until there are
+                no more events if not specified
+
+        Returns:
+            float: virtual time after the run
+        """
+        while self.events and (until is None or self.events[0][0] <= until):
+            when, _, callback, args = heapq.heappop(self.events)
+            self.now = when
+
+            if callback is not None:
+                callback(*args)
+
+        if until is not None:
+            self.now = max(self.now, until)
+
+        return self.now
@@ -0,0 +1,144 @@
+"""Stream of node events for external subscribers
+
+Bogchain publishes new blocks, reorgs and accepted transactions to
+EventHub, which passes them to subscribers as Server-Sent Events. Each
+event is serialized once, no matter how many subscribers receive it, and
+only when there is at least one subscriber.
+
+Every subscriber has bounded buffer. Subscriber whose buffer is full is
+dropped instead of slowing the node down or growing its memory, its stream
+ends with dropped event after which consumer should reload chain with
+/chain and subscribe again.
+"""
+
+import itertools
+import json
+import queue
+import threading
+
+from coin import metrics
+
+
+def format_event(event_id, kind, data):
+    """render event in text/event-stream format"""
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscriber:
+    """Single consumer of the event stream
+
+    Attributes:
+        kinds (set): kinds of events subscriber receives, None for all kinds
+        queue (queue.Queue): bounded buffer of rendered events
+        dropped (bool): True when subscriber was dropped for not keeping up
+    """
+
+    def __init__(self, kinds=None, buffer=1000):
+        self.kinds = set(kinds) if kinds else None
+        self.queue = queue.Queue(maxsize=buffer)
+        self.dropped = False
+
+    def wants(self, kind):
+        return self.kinds is None or kind in self.kinds
+
+
+class EventHub:
+    """Passes events published by the node to its subscribers
+
+    Attributes:
+        subscribers (list): list of coin.events.Subscriber
+        buffer (int): number of events buffered for each subscriber
+        max_subscribers (int): maximal number of subscribers
+        keepalive (float): time in seconds after which idle stream sends a comment,
+            so closed connections are noticed
+    """
+
+    kinds = ('block', 'reorg', 'transaction')
+
+    def __init__(self, **kwargs):
+        """Inits EventHub
+
+        Keyword Arguments:
+            buffer (int): number of events buffered for each subscriber, defaults to 1000
+            max_subscribers (int): maximal number of subscribers, defaults to 64
+            keepalive (float): keepalive interval of idle streams in seconds, defaults to 15
+        """
+        self.subscribers = []
+        self.buffer = kwargs.get('buffer', 1000)
+        self.max_subscribers = kwargs.get('max_subscribers', 64)
+        self.keepalive = kwargs.get('keepalive', 15.0)
+        self.sequence = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, kinds=None):
+        """add new subscriber
+
+        Parameters:
+            kinds (list): kinds of events to be received, all kinds if not provided
+
+        Returns:
+            coin.events.Subscriber: new subscriber, None if hub has maximal number of subscribers
+        """
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+
+            subscriber = Subscriber(kinds, self.buffer)
+            self.subscribers = self.subscribers + [subscriber]
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers = [other for other in self.subscribers if other is not subscriber]
+
+    def publish(self, kind, items):
+        """pass event for each item to subscribers interested in its kind
+
+        Parameters:
+            kind (str): kind of events, one of EventHub.kinds
+            items (iterable): event payloads, consumed only if someone subscribes to the kind,
+                so generators building payloads cost nothing without subscribers
+        """
+        subscribers = [subscriber for subscriber in self.subscribers if subscriber.wants(kind)]
+
+        if not subscribers:
+            return
+
+        for item in items:
+            message = format_event(next(self.sequence), kind, item)
+
+            for subscriber in subscribers:
+                if subscriber.dropped:
+                    continue
+
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    self.drop(subscriber)
+
+    def drop(self, subscriber):
+        """disconnect subscriber which doesn't keep up with events"""
+        subscriber.dropped = True
+        self.unsubscribe(subscriber)
+        metrics.dropped_subscribers.inc()
+
+    def stream(self, subscriber):
+        """generator of rendered events for streaming response
+
+        Ends with dropped event when subscriber is dropped, unsubscribes when
+        consumer disconnects.
+        """
+        try:
+            while not subscriber.dropped:
+                try:
+                    yield subscriber.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+
+            yield format_event(next(self.sequence), 'dropped', {'buffer': self.buffer})
+        finally:
+            self.unsubscribe(subscriber)
@@ -1,5 +1,10 @@
 import requests
-import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from coin import wire, metrics, profiling
+from coin.clock import Clock
 
 
 class Gossip:
@@ -10,6 +15,19 @@ class Gossip:
         key_pair (coin.KeyPair): rsa key pair
         node_id (str): app unique id
         local_url (str): app url
+        peer_formats (dict): dict mapping peer addresses to wire format negotiated
+            with that peer
+        peer_encodings (dict): dict mapping peer addresses to compression negotiated
+            with that peer
+        compression_threshold (int): minimal size in bytes of encoded payload that
+            gets compressed, None disables compression
+        compression_stats (coin.wire.CompressionStats): bytes saved and cpu time
+            spent on compression
+        peers (coin.Peers): app peers, requests outcome is recorded in their health
+        timeout (float): time in seconds after which request to peer is abandoned
+        session: object used for posting requests, requests module or simulated network
+        clock (coin.Clock): clock used for measuring request latency
+        flood_workers (int): number of peers flood posts to concurrently, 1 posts serially
     """
 
     def __init__(self, **kwargs):
@@ -19,11 +37,29 @@ class Gossip:
             logger (Flask.app.logger): app logger for debug
             key_pair (coin.KeyPair): rsa key pair
             node_id (str): app unique id
+            compression_threshold (int): minimal size in bytes of payload that gets
+                compressed, defaults to 1024, None disables compression
+            peers (coin.Peers): app peers
+            timeout (float): request timeout in seconds, defaults to 3
+            session: object with requests like post method, defaults to requests module
+            clock (coin.Clock): clock used for measuring request latency, defaults to real time
+            flood_workers (int): number of peers flood posts to concurrently, defaults to 8,
+                simulations post serially with 1 to stay deterministic
         """
         self.logger = kwargs['logger']
         self.key_pair = kwargs['key_pair']
         self.node_id = kwargs['node_id']
         self.local_url = None
+        self.peer_formats = {}
+        self.peer_encodings = {}
+        self.compression_threshold = kwargs.get('compression_threshold', 1024)
+        self.compression_stats = wire.CompressionStats()
+        self.peers = kwargs['peers']
+        self.timeout = kwargs.get('timeout', 3.0)
+        self.session = kwargs['session'] if kwargs.get('session') is not None else requests
+        self.clock = kwargs['clock'] if kwargs.get('clock') is not None else Clock()
+        self.flood_workers = kwargs.get('flood_workers', 8)
+        self.executor = ThreadPoolExecutor(max_workers=self.flood_workers) if self.flood_workers > 1 else None
 
     def get_headers(self, data):
         """create headers with signature and application id
@@ -34,36 +70,117 @@ class Gossip:
         Returns:
             dict: dict with origin header and signature header
         """
-        signature = self.key_pair.sign(json.dumps(data, sort_keys=True))
+        signature = self.key_pair.sign(wire.canonical(data))
         return {'origin-id': self.node_id, 'signature': signature}
 
-    def register_response(self, url, node_state):
-        """Send app state to a new peer
+    def post(self, address, path, data, headers=None):
+        """Post data to peer using wire format negotiated with it
+
+        Until peer advertises accepted formats data is sent as uncompressed json.
+        Payloads smaller than compression threshold are never compressed.
 
         Parameters:
-            url (str): url of a new peer
-            node_state (dict): current state of the app a dict containing
-                dict with peers and blockchain
+            address (str): peer address
+            path (str): peer endpoint path
+            data (dict): post body
+            headers (dict): additional request headers
+
+        Server errors count as failures in peer health, their response is
+        still returned.
 
         Returns:
-            bool: True if app state was posted successfully to new peer
+            requests.Response: peer response, None if request failed
         """
-        register_json = {
+        mimetype = self.peer_formats.get(address, wire.JSON)
+        headers = {**(headers or {}), 'Content-Type': mimetype}
+        body = wire.encode(data, mimetype)
+
+        encoding = self.peer_encodings.get(address, wire.IDENTITY)
+
+        if encoding != wire.IDENTITY and self.compression_threshold is not None \
+                and len(body) >= self.compression_threshold:
+            start_time = time.process_time()
+            compressed = wire.compress(body, encoding)
+            self.compression_stats.record(len(body), len(compressed), time.process_time() - start_time)
+            metrics.compression_saved.inc(len(body) - len(compressed))
+
+            body = compressed
+            headers['Content-Encoding'] = encoding
+
+        start_time = self.clock.monotonic()
+
+        try:
+            response = self.session.post(f"{address}{path}", data=body, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.peers.record_failure(address)
+            metrics.gossip_failures.inc(peer=address)
+            self.logger.info(f"Request to peer {address}{path} failed: {e.__class__.__name__}")
+            return None
+
+        if response.status_code >= 500:
+            self.peers.record_failure(address)
+            metrics.gossip_failures.inc(peer=address)
+            self.logger.info(f"Request to peer {address}{path} failed: status {response.status_code}")
+            return response
+
+        latency = self.clock.monotonic() - start_time
+        self.peers.record_success(address, latency)
+        metrics.gossip_latency.observe(latency, peer=address)
+        self.peer_formats[address] = wire.negotiate(response.headers.get('Accept-Post'))
+        self.peer_encodings[address] = wire.negotiate_encoding(response.headers.get('Accept-Encoding'))
+
+        return response
+
+    @property
+    def register_json(self):
+        """dict describing app to peers it registers with"""
+        return {
             'address': self.local_url,
             'node_id': self.node_id,
             'pub_key': self.key_pair.pub_key
         }
 
-        register_url = url + "/nodes/register"
+    def introduce(self, url):
+        """Register app with peer learned from peer exchange
+
+        Peer is not asked to respond with its state, app state reaches it
+        with next update.
+
+        Parameters:
+            url (str): url of the peer
+
+        Returns:
+            bool: True if peer knows app after the request
+        """
+        response = self.post(url, "/nodes/register", self.register_json, headers={'Registration-Resp': '1'})
+
+        return response is not None and response.status_code in (201, 409)
 
+    def register_response(self, url, node_state):
+        """Send app state to a new peer
+
+        Parameters:
+            url (str): url of a new peer
+            node_state (dict): current state of the app a dict containing
+                dict with peers and blockchain
+
+        Returns:
+            bool: True if app state was posted successfully to new peer
+        """
         self.logger.info("Registering self with new peer")
-        register_self_request = requests.post(register_url, json=register_json, headers={'Registration-Resp': '1'})
+        register_self_request = self.post(url, "/nodes/register", self.register_json,
+                                          headers={'Registration-Resp': '1'})
+
+        if register_self_request is None:
+            return False
 
         if register_self_request.status_code == 201:
-            update_url = url + "/update"
-            update_request = requests.post(update_url, json=node_state, headers=self.get_headers(node_state))
+            update_request = self.post(url, "/update", node_state, headers=self.get_headers(node_state))
             self.logger.info("Sending response with current node state")
 
+            if update_request is None:
+                return False
+
             if update_request.status_code == 200:
                 self.logger.info("Posting node state to peer successful")
                 return True
@@ -78,14 +195,29 @@ class Gossip:
         """Send app state to all peers unless peers to be omitted are
         specified
 
+        Data is signed once for all peers. Peers are contacted in order given
+        by addresses, coin.Peers yields fastest available peers first. With
+        flood workers posts run concurrently, so a peer hanging until timeout
+        doesn't hold back the others. Posts in worker threads are not covered
+        by the profiled gossip section.
+
         Parameters:
             path (str): another applications endpoint path
             data (dict): post body
             addresses (generator): a generator object that yields peer addresses
             excluded (list): List of peers to be excluded from app state update. Defaults to None
         """
+        with profiling.profiler.section(f"gossip {path}"):
+            headers = self.get_headers(data)
+            targets = [address for address in addresses if excluded is None or address not in excluded]
 
-        for address in addresses:
-            if excluded is None or address not in excluded:
-                post_request = requests.post(f"{address}{path}", json=data, headers=self.get_headers(data))
-                self.logger.info(f"Node state sent to peer request status code: {post_request.status_code}")
+            def send(address):
+                post_request = self.post(address, path, data, headers=headers)
+                if post_request is not None:
+                    self.logger.info(f"Node state sent to peer request status code: {post_request.status_code}")
+
+            if self.executor is not None and len(targets) > 1:
+                list(self.executor.map(send, targets))
+            else:
+                for address in targets:
+                    send(address)
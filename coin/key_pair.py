@@ -3,31 +3,115 @@ from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.exceptions import InvalidSignature
 
+import hashlib
+import os
+import threading
+
 from base64 import b64encode, b64decode
 
 
+def fingerprint(pub_key):
+    """hex sha256 of der encoded public key shortened to length of uuid hex
+
+    Parameters:
+        pub_key (str): base64 encoded der public key
+
+    Returns:
+        str: key fingerprint used as node id
+    """
+    return hashlib.sha256(b64decode(pub_key.encode())).hexdigest()[:32]
+
+
 class KeyPair:
     """RSA key pair along with methods for signature
     creation and verification.
 
+    Generating 2048 bit key takes hundreds of milliseconds, so key is
+    generated on first use instead of on construction.
+
     Attributes:
         private_key: cryptography RSA key pair
         pub_der: der encoded RSA public key
     """
 
-    def __init__(self):
-        """Generates rsa key pair, then der encodes public key"""
-        self.private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+    def __init__(self, private_key=None):
+        """Inits KeyPair
+
+        Parameters:
+            private_key: cryptography RSA private key, new one is generated on
+                first use if not provided
+        """
+        self._private_key = private_key
+        self._pub_der = None
+        self.lock = threading.Lock()
+
+    @property
+    def private_key(self):
+        if self._private_key is None:
+            with self.lock:
+                if self._private_key is None:
+                    self._private_key = rsa.generate_private_key(
+                        public_exponent=65537,
+                        key_size=2048,
+                        backend=default_backend()
+                    )
+
+        return self._private_key
+
+    @property
+    def pub_der(self):
+        if self._pub_der is None:
+            self._pub_der = self.private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.DER,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+
+        return self._pub_der
+
+    @classmethod
+    def load(cls, path):
+        """load key pair from unencrypted pem file
+
+        Parameters:
+            path (str): path of the key file
+
+        Returns:
+            coin.KeyPair: loaded key pair
+        """
+        with open(path, 'rb') as f:
+            private_key = serialization.load_pem_private_key(f.read(), password=None, backend=default_backend())
+
+        return cls(private_key)
 
-        self.pub_der = self.private_key.public_key().public_bytes(
-            encoding=serialization.Encoding.DER,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
+    def save(self, path):
+        """save private key to pem file readable only by its owner"""
+        pem = self.private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
         )
 
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+
+    @classmethod
+    def from_file(cls, path):
+        """load key pair from key file, generate and persist new one if file does not exist
+
+        Parameters:
+            path (str): path of the key file
+
+        Returns:
+            coin.KeyPair: key pair stored in the key file
+        """
+        if os.path.exists(path):
+            return cls.load(path)
+
+        key_pair = cls()
+        key_pair.save(path)
+        return key_pair
+
     def sign(self, data):
         """sign post data
 
@@ -83,3 +167,29 @@ class KeyPair:
             return False
 
         return True
+
+
+class KeyPool:
+    """Fixed number of key pairs handed out in turns
+
+    Lets simulations and tests create thousands of nodes while paying for
+    generation of only a few keys, each key is generated on first use.
+
+    Attributes:
+        key_pairs (list): list of coin.KeyPair
+    """
+
+    def __init__(self, size=1):
+        """Inits KeyPool
+
+        Parameters:
+            size (int): number of distinct key pairs
+        """
+        self.key_pairs = [KeyPair() for _ in range(size)]
+        self.next_index = 0
+
+    def get(self):
+        """return next key pair of the pool"""
+        key_pair = self.key_pairs[self.next_index]
+        self.next_index = (self.next_index + 1) % len(self.key_pairs)
+        return key_pair
@@ -0,0 +1,121 @@
+"""Merkle tree over block transactions
+
+Leaves are sha-256 digests of canonical transaction dicts. When a level
+has odd number of nodes the last one is paired with itself, so a list of
+transactions and the same list with its last transaction repeated share
+the root, blocks are required to have unique transactions instead. Proof of
+inclusion is a list of sibling hashes from the leaf up to the root, each
+tagged with side on which sibling lies.
+"""
+
+import hashlib
+
+from coin import wire
+
+
+empty_root = hashlib.sha256(b'').hexdigest()
+
+
+def leaf_hash(transaction):
+    """hash of a single transaction
+
+    Parameters:
+        transaction (coin.Transaction)
+
+    Returns:
+        str: sha-256 digest of canonical transaction dict
+    """
+    return wire.digest(transaction.to_dict())
+
+
+def node_hash(left, right):
+    """hash of an inner node from hex digests of its children"""
+    return hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def next_level(level):
+    """hash pairs of nodes into the level above"""
+    if len(level) % 2 == 1:
+        level = level + [level[-1]]
+
+    return [node_hash(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+
+def merkle_root(transactions):
+    """calculate merkle root of transactions
+
+    Parameters:
+        transactions (list): list of coin.Transaction
+
+    Returns:
+        str: hex digest of the root, digest of empty string for no transactions
+    """
+    return root_from_leaves([leaf_hash(transaction) for transaction in transactions])
+
+
+def root_from_leaves(leaves):
+    """calculate merkle root from already hashed leaves
+
+    Parameters:
+        leaves (list): hex digests returned by leaf_hash
+
+    Returns:
+        str: hex digest of the root, digest of empty string for no leaves
+    """
+    level = leaves
+
+    if not level:
+        return empty_root
+
+    while len(level) > 1:
+        level = next_level(level)
+
+    return level[0]
+
+
+def merkle_path(transactions, index):
+    """calculate proof of inclusion of a transaction
+
+    Parameters:
+        transactions (list): list of coin.Transaction
+        index (int): position of the proved transaction
+
+    Returns:
+        list: list of dicts with sibling 'hash' and its 'side', 'left' or 'right'
+    """
+    level = [leaf_hash(transaction) for transaction in transactions]
+    path = []
+
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level = level + [level[-1]]
+
+        sibling = index ^ 1
+        path.append({'hash': level[sibling], 'side': 'left' if sibling < index else 'right'})
+
+        level = next_level(level)
+        index //= 2
+
+    return path
+
+
+def verify_path(transaction_dict, path, root):
+    """verify proof of inclusion returned by merkle_path
+
+    Parameters:
+        transaction_dict (dict): dict view of the proved transaction
+        path (list): merkle path
+        root (str): merkle root from block header
+
+    Returns:
+        bool: True if transaction is included in the block
+    """
+    current = wire.digest(transaction_dict)
+
+    for step in path:
+        if step['side'] == 'left':
+            current = node_hash(step['hash'], current)
+        else:
+            current = node_hash(current, step['hash'])
+
+    return current == root
@@ -0,0 +1,220 @@
+"""Lightweight instrumentation exposed in prometheus text format
+
+Metrics are cheap enough to stay enabled all the time: each update takes a
+lock and touches a single dict entry, histograms find their bucket with
+bisect. Gauges that can be read from app state are evaluated only when
+metrics are scraped.
+
+All node metrics are defined at the bottom of this module and rendered
+with registry.render().
+"""
+
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+def format_labels(label_names, label_values, extra=None):
+    """render prometheus label set"""
+    pairs = list(zip(label_names, label_values))
+
+    if extra is not None:
+        pairs.append(extra)
+
+    if not pairs:
+        return ''
+
+    rendered = ','.join(f'{name}="{str(value)}"' for name, value in pairs)
+    return f'{{{rendered}}}'
+
+
+class Metric:
+    """Base class of metrics
+
+    Attributes:
+        name (str): metric name
+        help (str): metric description
+        label_names (tuple): names of metric labels
+        kind (str): prometheus metric type
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self):
+        """yield rendered sample lines"""
+        with self.lock:
+            values = list(self.values.items())
+
+        for label_values, value in values:
+            yield f'{self.name}{format_labels(self.label_names, label_values)} {value}'
+
+    def render(self):
+        return '\n'.join([f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', *self.samples()])
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        if not self.label_names:
+            self.values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down, optionally read from a function on scrape"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self.function = None
+        if not self.label_names:
+            self.values[()] = 0
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function):
+        """evaluate function on every scrape instead of storing value
+
+        Parameters:
+            function (callable): function without arguments returning gauge value
+        """
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            yield f'{self.name} {self.function()}'
+        else:
+            yield from super().samples()
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = 'histogram'
+
+    default_buckets = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, name, help_text, label_names=(), buckets=default_buckets):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """observe duration of the with block in seconds"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self.values.items()]
+
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names, label_values, ('le', bound))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+
+            labels = format_labels(self.label_names, label_values)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """render all metrics in prometheus text exposition format"""
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+registry = Registry()
+
+hashes = registry.register(Counter(
+    'bogo_hashes_total', "Proof of work hashes computed"))
+hash_rate = registry.register(Gauge(
+    'bogo_hash_rate', "Hashes per second of the last proof of work"))
+mining_duration = registry.register(Histogram(
+    'bogo_mining_duration_seconds', "Duration of mining a block, including throttle",
+    buckets=(.01, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)))
+blocks_mined = registry.register(Counter(
+    'bogo_blocks_mined_total', "Blocks mined by the node"))
+mempool_depth = registry.register(Gauge(
+    'bogo_mempool_depth', "Transactions waiting to be mined"))
+chain_length = registry.register(Gauge(
+    'bogo_chain_length', "Length of the node blockchain"))
+block_propagation = registry.register(Histogram(
+    'bogo_block_propagation_seconds', "Time from mining a block to receiving it in accepted chain"))
+update_chain_duration = registry.register(Histogram(
+    'bogo_update_chain_duration_seconds', "Duration of processing chain received from peer"))
+valid_chain_duration = registry.register(Histogram(
+    'bogo_valid_chain_duration_seconds', "Duration of chain validation"))
+pruned_blocks = registry.register(Counter(
+    'bogo_pruned_blocks_total', "Blocks folded into snapshot and dropped from memory"))
+chain_replacements = registry.register(Counter(
+    'bogo_chain_replacements_total', "Chains received from peers that replaced local chain"))
+reorgs = registry.register(Counter(
+    'bogo_reorgs_total', "Chain replacements that dropped blocks of the local chain"))
+verified_transactions = registry.register(Counter(
+    'bogo_verified_transactions_total', "Transaction signatures verified, not counting cached transactions"))
+signature_verify_duration = registry.register(Histogram(
+    'bogo_signature_verify_duration_seconds', "Duration of request signature verification", ['route']))
+gossip_latency = registry.register(Histogram(
+    'bogo_gossip_request_duration_seconds', "Duration of successful requests to peers", ['peer']))
+gossip_failures = registry.register(Counter(
+    'bogo_gossip_failures_total', "Failed or timed out requests to peers", ['peer']))
+relay_batch_size = registry.register(Histogram(
+    'bogo_relay_batch_size', "Transactions in batches relayed to peers",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)))
+event_subscribers = registry.register(Gauge(
+    'bogo_event_subscribers', "Clients subscribed to the event stream"))
+dropped_subscribers = registry.register(Counter(
+    'bogo_dropped_subscribers_total', "Event stream subscribers dropped for not keeping up"))
+compression_saved = registry.register(Counter(
+    'bogo_compression_saved_bytes_total', "Bytes saved by compressing payloads sent to peers"))
@@ -1,24 +1,219 @@
+import random
+import threading
+
+from coin.clock import Clock
+from coin.key_pair import fingerprint
+
+
+class PeerHealth:
+    """Health of a single peer used for circuit breaker like backoff
+
+    After failure_threshold consecutive failed requests peer is considered
+    unavailable until backoff time passes. Then single request is let through,
+    if it fails too backoff time doubles, up to max_backoff.
+
+    Attributes:
+        latency (float): exponentially weighted moving average of request latency
+            in seconds, None until first successful request
+        consecutive_failures (int): number of failed requests since last success
+        last_seen (float): unix time of last successful request, None if never
+        retry_at (float): monotonic time after which unavailable peer may be retried
+        clock (coin.Clock): source of time, coin.SimulatedClock in simulations
+    """
+
+    __slots__ = ('latency', 'consecutive_failures', 'last_seen', 'retry_at', 'clock')
+
+    smoothing = 0.3
+    failure_threshold = 3
+    base_backoff = 1.0
+    max_backoff = 60.0
+
+    def __init__(self, clock=None):
+        self.latency = None
+        self.consecutive_failures = 0
+        self.last_seen = None
+        self.retry_at = 0.0
+        self.clock = clock if clock is not None else Clock()
+
+    def record_success(self, latency):
+        """update health after successful request
+
+        Parameters:
+            latency (float): request duration in seconds
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += PeerHealth.smoothing * (latency - self.latency)
+
+        self.consecutive_failures = 0
+        self.last_seen = self.clock.time()
+        self.retry_at = 0.0
+
+    def record_failure(self):
+        """update health after failed or timed out request"""
+        self.consecutive_failures += 1
+
+        if self.consecutive_failures >= PeerHealth.failure_threshold:
+            exponent = self.consecutive_failures - PeerHealth.failure_threshold
+            backoff = min(PeerHealth.base_backoff * 2 ** exponent, PeerHealth.max_backoff)
+            self.retry_at = self.clock.monotonic() + backoff
+
+    @property
+    def available(self):
+        """True if requests to the peer should be attempted"""
+        return self.consecutive_failures < PeerHealth.failure_threshold or self.clock.monotonic() >= self.retry_at
+
+    def as_dict(self):
+        return {
+            'latency_ms': round(self.latency * 1e3, 3) if self.latency is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'last_seen': self.last_seen,
+            'available': self.available
+        }
+
+
 class Peers:
     """Class for storing peer applications info
 
+    Peer table is bounded, so memory of a node and size of its updates
+    don't grow with the network. App looks for new peers only until it has
+    max_outbound of them, remaining room is left for peers registering with
+    it. Connections go both ways, updates are sent to every available peer
+    of the table. Peers are exchanged as random samples of the table.
+
     Attributes:
         addresses_pub_keys (dict): dict mapping peer ids to dicts containing
             peer address and public key
         node_ids (dict): dict mapping peer addresses to their ids
-
+        health (dict): dict mapping peer addresses to coin.PeerHealth
+        max_peers (int): maximal number of peers in the table
+        max_outbound (int): number of peers app connects to on its own
+        exchange_size (int): number of peers shared with other apps
+        random (random.Random): source of randomness for peer sampling
+        verify_ids (bool): check that peer ids are fingerprints of their public keys
+        clock (coin.Clock): source of time of peer health, coin.SimulatedClock in simulations
+        lock (threading.RLock): guards the table, it is changed by flask threads
+            while gossip threads read it and record peer health
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
+        """Inits Peers
+
+        Keyword Arguments:
+            max_peers (int): maximal number of peers in the table, defaults to 32
+            max_outbound (int): number of peers app connects to on its own, defaults to 8
+            exchange_size (int): number of peers shared with other apps, defaults to 8
+            random (random.Random): source of randomness, coin.SimulatedClock.random in simulations
+            verify_ids (bool): check that peer ids are fingerprints of their public keys, defaults to True,
+                simulations sharing key pairs between nodes turn it off
+            clock (coin.Clock): source of time of peer health, defaults to real time clock
+        """
         self.addresses_pub_keys = {}
         self.node_ids = {}
+        self.health = {}
+        self.max_peers = kwargs.get('max_peers', 32)
+        self.max_outbound = kwargs.get('max_outbound', 8)
+        self.exchange_size = kwargs.get('exchange_size', 8)
+        self.random = kwargs['random'] if kwargs.get('random') is not None else random.Random()
+        self.verify_ids = kwargs.get('verify_ids', True)
+        self.clock = kwargs['clock'] if kwargs.get('clock') is not None else Clock()
+        self.lock = threading.RLock()
+
+    def __contains__(self, node_id):
+        return node_id in self.addresses_pub_keys
+
+    def __len__(self):
+        return len(self.addresses_pub_keys)
+
+    @property
+    def full(self):
+        """bool: True if peer table reached max_peers"""
+        return len(self.addresses_pub_keys) >= self.max_peers
+
+    @property
+    def wanted(self):
+        """bool: True if app has less than max_outbound peers and looks for more"""
+        return len(self.addresses_pub_keys) < self.max_outbound
+
+    def valid_id(self, node_id, pub_key):
+        """check that peer id is fingerprint of its public key, so peer can't pose as another node"""
+        if not self.verify_ids:
+            return True
+
+        try:
+            return fingerprint(pub_key) == node_id
+        except (AttributeError, ValueError):
+            return False
 
     def add_peer(self, address, node_id, pub_key):
-        if node_id not in self.addresses_pub_keys.keys():
+        """add peer unless it is already known, its id is not valid or peer table is full
+
+        Full table makes room for new peer by evicting unavailable peer
+        with most consecutive failures, if there is any. Peer restarted with
+        new id replaces its old entry once the old entry became unavailable,
+        so an available peer can't be taken over by registering its address.
+
+        Returns:
+            bool: True if peer was added
+        """
+        if not self.valid_id(node_id, pub_key):
+            return False
+
+        with self.lock:
+            if node_id in self.addresses_pub_keys:
+                return False
+
+            if address in self.node_ids:
+                if self.health[address].available:
+                    return False
+
+                self.remove_peer(self.node_ids[address])
+
+            if self.full and not self.evict_unavailable():
+                return False
+
             self.addresses_pub_keys[node_id] = {'address': address, 'pub_key': pub_key}
             self.node_ids[address] = node_id
+            self.health[address] = PeerHealth(self.clock)
             return True
 
-        return False
+    def remove_peer(self, node_id):
+        """remove peer from the table, unknown ids are ignored"""
+        with self.lock:
+            node = self.addresses_pub_keys.pop(node_id, None)
+
+            if node is not None:
+                self.node_ids.pop(node['address'], None)
+                self.health.pop(node['address'], None)
+
+    def evict_unavailable(self):
+        """remove unavailable peer with most consecutive failures
+
+        Returns:
+            bool: True if peer was removed
+        """
+        with self.lock:
+            failures = {address: health.consecutive_failures
+                        for address, health in self.health.items() if not health.available}
+
+            if not failures:
+                return False
+
+            self.remove_peer(self.node_ids[max(failures, key=failures.get)])
+            return True
+
+    def sample(self):
+        """random sample of available peers shared with other apps
+
+        Returns:
+            dict: dict mapping up to exchange_size peer ids to their addresses and public keys
+        """
+        with self.lock:
+            available = [self.node_ids[address] for address, health in self.health.items() if health.available]
+            chosen = self.random.sample(available, min(self.exchange_size, len(available)))
+
+            return {node_id: self.addresses_pub_keys[node_id] for node_id in chosen}
 
     def get_address(self, node_id):
         node = self.addresses_pub_keys.get(node_id)
@@ -36,8 +231,42 @@ class Peers:
         else:
             return None
 
+    def record_success(self, address, latency):
+        """record successful request to peer, unknown addresses are ignored"""
+        with self.lock:
+            health = self.health.get(address)
+
+            if health is not None:
+                health.record_success(latency)
+
+    def record_failure(self, address):
+        """record failed request to peer, unknown addresses are ignored"""
+        with self.lock:
+            health = self.health.get(address)
+
+            if health is not None:
+                health.record_failure()
+
     @property
     def addresses(self):
-        """Return generator with peer addresses"""
-        for peer in self.addresses_pub_keys.values():
-            yield peer['address']
+        """Return generator with addresses of available peers, fastest peers first
+
+        Peers without latency measurement yet go after measured ones. Peers
+        whose last request failed go last whatever their latency, so a fast
+        peer that started hanging doesn't delay everyone else.
+        """
+        with self.lock:
+            available = [(health.consecutive_failures > 0, health.latency is None, health.latency or 0, address)
+                         for address, health in self.health.items() if health.available]
+
+        available.sort(key=lambda peer: peer[:3])
+
+        for *_, address in available:
+            yield address
+
+    @property
+    def stats(self):
+        """dict mapping peer addresses to their ids and health"""
+        with self.lock:
+            return {address: {'node_id': node_id, **self.health[address].as_dict()}
+                    for address, node_id in self.node_ids.items()}
@@ -0,0 +1,170 @@
+"""Profiling of node sections that can be switched on at runtime
+
+Profiling is off by default and costs a single check per section run.
+Profiler.start opens a time window during which every run of a profiled
+section (mining, flask routes, gossip sends) is recorded with its own
+cProfile.Profile. Profiles of finished runs are merged into pstats.Stats
+of their section and served as text report, so a slow node can be
+inspected without restart.
+
+cProfile follows only the thread that enabled it, so sections are
+profiled in threads running them. Section started in a thread which is
+already profiled is counted in the outer section.
+
+Node profiler is defined at the bottom of this module.
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Collects cProfile statistics of node sections during profiling window
+
+    Attributes:
+        deadline (float): monotonic time at which profiling window closes, None if profiling is off
+        sections (set): names of profiled sections, None profiles all sections
+        stats (dict): dict mapping section names to their merged pstats.Stats
+        runs (dict): dict mapping section names to number of profiled runs
+        window (float): default length of profiling window in seconds
+    """
+
+    def __init__(self, window=30.0):
+        self.deadline = None
+        self.sections = None
+        self.stats = {}
+        self.runs = {}
+        self.window = window
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def active(self):
+        """True while profiling window is open"""
+        deadline = self.deadline
+        return deadline is not None and time.monotonic() < deadline
+
+    def start(self, duration=None, sections=None):
+        """open new profiling window dropping statistics of the previous one
+
+        Parameters:
+            duration (float): length of the window in seconds, defaults to profiler window
+            sections (list): names of sections to be profiled, all sections if not provided
+        """
+        with self.lock:
+            self.stats = {}
+            self.runs = {}
+            self.sections = set(sections) if sections else None
+            self.deadline = time.monotonic() + (duration if duration is not None else self.window)
+
+    def stop(self):
+        """close profiling window, collected statistics are kept"""
+        self.deadline = None
+
+    def begin(self, section):
+        """start profiling run of a section in the current thread
+
+        Returns:
+            cProfile.Profile: profile to be passed to end, None if section is not profiled
+        """
+        if not self.active or getattr(self.local, 'profiling', False):
+            return None
+
+        if self.sections is not None and section not in self.sections:
+            return None
+
+        profile = cProfile.Profile()
+
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is already active in this thread
+            return None
+
+        self.local.profiling = True
+        return profile
+
+    def end(self, section, profile):
+        """finish profiling run of a section and merge it into section statistics
+
+        Parameters:
+            section (str): name of the section
+            profile (cProfile.Profile): profile returned by begin, None is ignored
+        """
+        if profile is None:
+            return
+
+        profile.disable()
+        self.local.profiling = False
+
+        with self.lock:
+            if section in self.stats:
+                self.stats[section].add(profile)
+            else:
+                self.stats[section] = pstats.Stats(profile)
+
+            self.runs[section] = self.runs.get(section, 0) + 1
+
+    @contextmanager
+    def section(self, name):
+        """profile block of code as a run of named section"""
+        profile = self.begin(name)
+
+        try:
+            yield
+        finally:
+            self.end(name, profile)
+
+    @property
+    def status(self):
+        """dict describing profiling window and profiled runs of each section"""
+        deadline = self.deadline
+        remaining = max(deadline - time.monotonic(), 0) if deadline is not None else 0
+
+        with self.lock:
+            runs = dict(self.runs)
+
+        return {
+            'active': remaining > 0,
+            'remaining': round(remaining, 3),
+            'sections': sorted(self.sections) if self.sections is not None else None,
+            'runs': runs
+        }
+
+    def report(self, sort='cumulative', limit=30, section=None):
+        """render collected statistics as text
+
+        Parameters:
+            sort (str): pstats sort key, e.g. cumulative, tottime or ncalls
+            limit (int): number of functions listed for each section
+            section (str): name of the only section to be rendered, all sections if not provided
+
+        Returns:
+            str: pstats report of each section
+
+        Raises:
+            KeyError: when sort key is not known to pstats
+        """
+        status = self.status
+        out = io.StringIO()
+        state = f"active, {status['remaining']}s left" if status['active'] else "inactive"
+        out.write(f"profiling {state}\n")
+
+        with self.lock:
+            for name in sorted(self.stats):
+                if section is not None and name != section:
+                    continue
+
+                out.write(f"\n=== {name}, {self.runs[name]} runs ===\n")
+                self.stats[name].stream = out
+                self.stats[name].sort_stats(sort).print_stats(limit)
+
+        return out.getvalue()
+
+
+profiler = Profiler()
@@ -0,0 +1,87 @@
+import threading
+
+from coin import metrics
+from coin.clock import Clock
+
+
+class TransactionRelay:
+    """Coalesces outgoing transactions into batches flooded to peers
+
+    Transactions added within relay window are sent to every peer as a
+    single signed /transactions/process/batch request, so signing and http
+    cost is paid once per batch instead of once per transaction.
+
+    Attributes:
+        gossip (coin.Gossip): gossip used for flooding batches
+        peers (coin.Peers): app peers receiving batches
+        window (float): time in seconds transactions are collected before
+            they are sent, 0 or None sends every added batch right away
+        max_batch (int): number of pending transactions that are sent without
+            waiting for the end of the window
+        pending (list): transaction dicts waiting to be sent
+        flush_event: clock handle of scheduled flush, None if none is scheduled
+        clock (coin.Clock): clock scheduling flushes
+    """
+
+    def __init__(self, **kwargs):
+        """Inits TransactionRelay
+
+        Keyword Arguments:
+            gossip (coin.Gossip): gossip used for flooding batches
+            peers (coin.Peers): app peers
+            window (float): relay window in seconds, defaults to 0.05
+            max_batch (int): maximal number of transactions in a batch, defaults to 500
+            clock (coin.Clock): clock scheduling flushes, defaults to real time
+        """
+        self.gossip = kwargs['gossip']
+        self.peers = kwargs['peers']
+        self.window = kwargs.get('window', 0.05)
+        self.max_batch = kwargs.get('max_batch', 500)
+        self.clock = kwargs['clock'] if kwargs.get('clock') is not None else Clock()
+        self.pending = []
+        self.flush_event = None
+        self.lock = threading.Lock()
+
+    def add(self, transactions):
+        """queue transactions for relaying
+
+        Parameters:
+            transactions (list): transaction dicts with sender, recipient, amount and id
+        """
+        if not self.window:
+            self.send(transactions)
+            return
+
+        with self.lock:
+            self.pending.extend(transactions)
+            full = len(self.pending) >= self.max_batch
+
+            if not full and self.flush_event is None:
+                self.flush_event = self.clock.call_later(self.window, self.flush)
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """send all pending transactions"""
+        with self.lock:
+            batch, self.pending = self.pending, []
+
+            if self.flush_event is not None:
+                self.clock.cancel(self.flush_event)
+                self.flush_event = None
+
+        for start in range(0, len(batch), self.max_batch):
+            self.send(batch[start:start + self.max_batch])
+
+    def send(self, batch):
+        """flood batch to peers, single transactions go to /transactions/process"""
+        if not batch:
+            return
+
+        metrics.relay_batch_size.observe(len(batch))
+
+        if len(batch) == 1:
+            self.gossip.flood("/transactions/process", batch[0], self.peers.addresses)
+        else:
+            self.gossip.flood("/transactions/process/batch", {'transactions': batch}, self.peers.addresses)
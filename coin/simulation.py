@@ -0,0 +1,479 @@
+"""Deterministic in-process simulation of bogo coin network
+
+All nodes live in a single process and share coin.SimulatedClock. Requests
+between nodes are delivered immediately through SimulatedNetwork instead
+of http, mining is modelled as an event finishing after virtual time
+needed to compute the proof with configured hash rate. Schedule files are
+run by TestScheduler as events, so scenarios relying on sleeps finish as
+fast as the events can be processed and give identical results for the
+same seed.
+
+Usage:
+    python -m coin.simulation [-d DURATION] [--seed SEED] [--difficulty DIFFICULTY]
+        [--hash-rate HASH_RATE] [--keys KEYS] -n "NODE_OPTIONS" [-n "NODE_OPTIONS" ...]
+
+    NODE_OPTIONS are app.py options: -p PORT [-G] [-s SCHEDULE] [-a ACCUMULATION] [-T THROTTLE]
+        [-r RELAY_WINDOW] [--max-peers MAX_PEERS] [--max-outbound MAX_OUTBOUND] [--prune-depth PRUNE_DEPTH]
+"""
+
+import json
+import logging
+import shlex
+
+import requests
+
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+from coin.bogchain import Bogchain
+from coin.clock import SimulatedClock
+from coin.gossip import Gossip
+from coin.key_pair import KeyPool
+from coin.peers import Peers
+from coin.relay import TransactionRelay
+from coin.test_scheduler import TestScheduler, ParallelBlock
+from coin import wire, checks
+
+
+class SimulatedResponse:
+    """Minimal stand-in for requests.Response"""
+
+    def __init__(self, status_code, body, request_body):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {}
+        self.request = SimpleNamespace(body=request_body)
+
+    @property
+    def text(self):
+        return self.body if isinstance(self.body, str) else json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+class SimulatedNetwork:
+    """Delivers requests to simulated nodes by their address
+
+    Attributes:
+        nodes (dict): dict mapping node addresses to coin.simulation.SimulatedNode
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def post(self, url, data=None, json=None, headers=None, timeout=None):
+        """deliver post request, mirrors requests.post signature
+
+        Returns:
+            coin.simulation.SimulatedResponse: response of the node
+
+        Raises:
+            requests.ConnectionError: when no node listens on the address, e.g. it was killed
+        """
+        headers = headers or {}
+
+        if json is None:
+            body = wire.decompress(data, headers.get('Content-Encoding'))
+            json = wire.decode(body, headers.get('Content-Type', wire.JSON))
+
+        request_body = wire.encode(json)
+
+        for address, node in self.nodes.items():
+            if url.startswith(address):
+                status_code, response_body = node.handle(url[len(address):], json, headers)
+                return SimulatedResponse(status_code, response_body, request_body)
+
+        raise requests.ConnectionError(f"No node listens on {url}")
+
+
+class SimulatedNode:
+    """Single node of the simulated network
+
+    Receiving side checks requests and runs route bodies of Bogchain the
+    same way endpoints of app.py do, mining loop of
+    Bogchain.handle_transactions is replaced with clock events.
+
+    Attributes:
+        address (str): node url
+        bogchain (coin.Bogchain): node blockchain
+        gossip (coin.Gossip): node gossip
+        relay (coin.relay.TransactionRelay): relay batching outgoing transactions
+        scheduler (coin.TestScheduler): scheduler running node schedule file, None without schedule
+        accumulation_period (float): time node waits before it starts to mine transactions
+        mining_event (list): clock event of block being mined, None when node is not mining
+        round_event (list): clock event of upcoming mining round, None if none is planned
+    """
+
+    # required keys, required keys of batch transactions, signer and handler of each path,
+    # mirroring decorators of app.py routes, transactions of simulated nodes are not signed
+    routes = {
+        '/nodes/register': (('address', 'node_id', 'pub_key'), None, None, 'register'),
+        '/update': (('chain', 'peers'), None, 'foreign', 'update'),
+        '/transactions/process': (('sender', 'recipient', 'amount', 'id'), None, 'foreign', 'process_transaction'),
+        '/transactions/process/batch': (('transactions',), ('sender', 'recipient', 'amount', 'id'), 'foreign',
+                                        'process_transactions_batch'),
+        '/transactions/new': (('recipient', 'amount'), None, 'local', 'new_transaction'),
+        '/transactions/new/batch': (('transactions',), ('recipient', 'amount'), 'local', 'new_transactions_batch'),
+        '/test': ((), None, 'foreign', 'test')
+    }
+
+    def __init__(self, simulation, port, genesis=False, schedule=None, accumulation_period=0.5, throttle=None,
+                 relay_window=0.05, max_peers=32, max_outbound=8, prune_depth=None):
+        self.simulation = simulation
+        self.clock = simulation.clock
+        self.address = f"http://127.0.0.1:{port}"
+        self.accumulation_period = accumulation_period
+        self.throttle = throttle
+        self.mining_event = None
+        self.round_event = None
+
+        node_id = self.clock.uuid().hex
+        logger = logging.getLogger(f"simulation.{port}")
+        key_pair = simulation.key_pool.get()
+        peers = Peers(max_peers=max_peers, max_outbound=max_outbound, random=self.clock.random, verify_ids=False,
+                      clock=self.clock)
+
+        self.gossip = Gossip(logger=logger, key_pair=key_pair, node_id=node_id, peers=peers,
+                             session=simulation.network, clock=self.clock, compression_threshold=None,
+                             flood_workers=1)
+        self.gossip.local_url = self.address
+        self.bogchain = Bogchain(node_id=node_id, logger=logger, gossip=self.gossip, peers=peers, clock=self.clock,
+                                 prune_depth=prune_depth)
+        self.relay = TransactionRelay(gossip=self.gossip, peers=peers, window=relay_window, clock=self.clock)
+
+        if genesis:
+            self.bogchain.create_genesis_block()
+
+        self.scheduler = None
+
+        if schedule is not None:
+            self.scheduler = TestScheduler(schedule,
+                                           app_kill_event=SimpleNamespace(set=self.kill),
+                                           bogchain=self.bogchain,
+                                           key_pair=key_pair,
+                                           url=self.address,
+                                           clock=self.clock,
+                                           session=simulation.network,
+                                           sign_transactions=False)
+
+    def start(self):
+        """schedule first command of the schedule file"""
+        if self.scheduler is not None:
+            self.run_plan(iter(self.scheduler.compile()))
+
+    def run_plan(self, plan):
+        """run next item of compiled schedule, steps of parallel block run as independent event chains"""
+        item = next(plan, None)
+
+        if item is None:
+            return
+
+        if not isinstance(item, ParallelBlock):
+            self.run_calls(self.step_calls(item), item, lambda: self.run_plan(plan))
+            return
+
+        remaining = [len(item.steps)]
+
+        def step_finished():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.run_plan(plan)
+
+        if not item.steps:
+            self.run_plan(plan)
+
+        for step in item.steps:
+            self.run_calls(self.step_calls(step), step, step_finished)
+
+    @staticmethod
+    def step_calls(step):
+        """yield sleep time before every call of the step, rate commands are expanded into evenly spaced calls"""
+        for _ in range(step.repeat):
+            if step.load is None:
+                yield step.sleep_time
+                continue
+
+            rate, duration = step.load
+            for i in range(int(rate * duration)):
+                yield step.sleep_time if i == 0 else 1 / rate
+
+    def run_calls(self, calls, step, done):
+        sleep_time = next(calls, None)
+
+        if sleep_time is None:
+            done()
+            return
+
+        self.clock.call_later(sleep_time, self.call_step, calls, step, done)
+
+    def call_step(self, calls, step, done):
+        if step.method is not None:
+            self.scheduler.log([0, step.method_name, *step.args])
+
+            try:
+                step.method(*step.args)
+            except requests.RequestException as e:
+                self.bogchain.logger.info(f"Step {step.method_name} failed: {e.__class__.__name__}")
+
+            # forging node stops mining like the real transaction loop does
+            if self.bogchain.evil:
+                self.cancel_mining()
+
+        self.run_calls(calls, step, done)
+
+    def kill(self):
+        self.simulation.network.nodes.pop(self.address, None)
+        self.cancel_mining()
+
+    def handle(self, path, payload, headers):
+        """handle request delivered by simulated network
+
+        Request passes the same key and signature checks as requests to app
+        routes before its handler runs.
+
+        Returns:
+            tuple: status code and response body
+        """
+        route = SimulatedNode.routes.get(path)
+
+        if route is None:
+            return 404, "Not found"
+
+        required, batch_required, signer, handler = route
+        error = checks.check_keys(payload, required)
+
+        if error is None and batch_required is not None:
+            error = checks.check_batch_keys(payload['transactions'], batch_required)
+
+        if error is None and signer is not None:
+            if signer == 'local':
+                pub_key = self.gossip.key_pair.pub_key
+            else:
+                pub_key = self.bogchain.peers.get_pub_key(headers.get('origin-id'))
+
+            error = checks.check_signature(headers.get('signature'), payload, pub_key)
+
+        if error is not None:
+            message, status_code = error
+            return status_code, message
+
+        return getattr(self, handler)(payload, headers)
+
+    def register(self, node, headers):
+        body, status_code = self.bogchain.register_peer(node, "Registration-Resp" not in headers)
+        return status_code, body
+
+    def update(self, update_json, headers):
+        response = self.bogchain.receive_update(update_json, headers.get('origin-id'))
+
+        if response['updated'] and self.mining_event is not None:
+            self.cancel_mining()
+            if self.bogchain.pending_transactions:
+                self.plan_round()
+
+        return 200, response
+
+    def process_transaction(self, trans_json, headers):
+        error = self.bogchain.receive_transactions([trans_json])
+
+        if error is not None:
+            message, status_code = error
+            return status_code, message
+
+        if not self.bogchain.evil:
+            self.plan_round()
+
+        return 201, f"New transaction {trans_json['amount']} from {trans_json['sender']} to {trans_json['recipient']}"
+
+    def new_transaction(self, trans_json, headers):
+        try:
+            transactions = self.bogchain.new_transactions([trans_json])
+        except TypeError as e:
+            return 400, str(e)
+
+        self.relay.add([transaction.to_dict() for transaction in transactions])
+
+        return 201, f"Outgoing transaction {trans_json['amount']} to {trans_json['recipient']}"
+
+    def process_transactions_batch(self, batch_json, headers):
+        transactions = batch_json['transactions']
+        error = self.bogchain.receive_transactions(transactions)
+
+        if error is not None:
+            message, status_code = error
+            return status_code, message
+
+        if not self.bogchain.evil:
+            self.plan_round()
+
+        return 201, f"New transactions batch of {len(transactions)}"
+
+    def new_transactions_batch(self, batch_json, headers):
+        try:
+            transactions = self.bogchain.new_transactions(batch_json['transactions'])
+        except TypeError as e:
+            return 400, str(e)
+
+        self.relay.add([transaction.to_dict() for transaction in transactions])
+
+        return 201, f"Outgoing transactions batch of {len(transactions)}"
+
+    def test(self, payload, headers):
+        return 200, "OK"
+
+    def plan_round(self):
+        """start mining round after accumulation period unless one is planned or running"""
+        if self.round_event is None and self.mining_event is None:
+            self.round_event = self.clock.call_later(self.accumulation_period, self.begin_round)
+
+    def begin_round(self):
+        self.round_event = None
+
+        if self.bogchain.evil:
+            return
+
+        template = self.bogchain.begin_mining_round()
+
+        if template is None:
+            return
+
+        proof = self.bogchain.proof_of_work(template.work_hash)
+        mining_time = (proof + 1) / self.simulation.hash_rate + (self.throttle or 0)
+
+        self.mining_event = self.clock.call_later(mining_time, self.finish_round, template, proof)
+
+    def finish_round(self, template, proof):
+        self.mining_event = None
+        self.bogchain.commit_mined_block(template, proof)
+
+        if self.bogchain.pending_transactions:
+            self.plan_round()
+
+    def cancel_mining(self):
+        for event in (self.mining_event, self.round_event):
+            if event is not None:
+                self.clock.cancel(event)
+
+        self.mining_event = None
+        self.round_event = None
+
+    @property
+    def state(self):
+        """summary of node state used to compare simulation runs"""
+        return {
+            'node_id': self.bogchain.node_id,
+            'length': self.bogchain.height,
+            'last_hash': self.bogchain.last_block.hash if self.bogchain.chain else None,
+            'balance': self.bogchain.balance(self.bogchain.node_id)
+        }
+
+
+class Simulation:
+    """Network of simulated nodes sharing virtual clock
+
+    Attributes:
+        clock (coin.SimulatedClock): virtual clock driving the simulation
+        network (coin.simulation.SimulatedNetwork): network delivering requests
+        hash_rate (float): simulated hashes per second of every node
+        nodes (list): list of coin.simulation.SimulatedNode
+        key_pool (coin.KeyPool): key pairs shared by simulated nodes, request signatures
+            are verified, transactions are not signed
+    """
+
+    def __init__(self, seed=0, hash_rate=1e6, keys=1):
+        self.clock = SimulatedClock(seed)
+        self.network = SimulatedNetwork()
+        self.hash_rate = hash_rate
+        self.nodes = []
+        self.key_pool = KeyPool(keys)
+
+    def add_node(self, port, **kwargs):
+        """add node to the network
+
+        Parameters:
+            port (int): node port used in its address
+
+        Keyword Arguments:
+            genesis (bool): initiate node with genesis block
+            schedule (str): path of schedule file
+            accumulation_period (float): time node waits before it starts to mine
+            throttle (float): additional virtual time of every mining
+            relay_window (float): time in virtual seconds outgoing transactions are batched
+            max_peers (int): maximal number of peers in peer table
+            max_outbound (int): number of peers node connects to on its own
+            prune_depth (int): number of newest blocks kept in memory
+
+        Returns:
+            coin.simulation.SimulatedNode: new node
+        """
+        node = SimulatedNode(self, port, **kwargs)
+        self.network.nodes[node.address] = node
+        self.nodes.append(node)
+        return node
+
+    def run(self, duration):
+        """run simulation for virtual duration in seconds
+
+        Returns:
+            list: state of every node
+        """
+        for node in self.nodes:
+            node.start()
+
+        self.clock.run(until=self.clock.now + duration)
+
+        return [node.state for node in self.nodes]
+
+
+def node_arguments(options):
+    """parse node options written like app.py arguments"""
+    arg_parser = ArgumentParser(prog='node')
+    arg_parser.add_argument('-p', '--port', default=5000, type=int)
+    arg_parser.add_argument('-G', '--genesis', action="store_true")
+    arg_parser.add_argument('-s', '--schedule', default=None, type=str)
+    arg_parser.add_argument('-a', '--accumulation', default=0.5, type=float)
+    arg_parser.add_argument('-T', '--throttle', default=None, type=float)
+    arg_parser.add_argument('-r', '--relay-window', default=0.05, type=float)
+    arg_parser.add_argument('--max-peers', default=32, type=int)
+    arg_parser.add_argument('--max-outbound', default=8, type=int)
+    arg_parser.add_argument('--prune-depth', default=None, type=int)
+
+    return arg_parser.parse_args(shlex.split(options))
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(prog='python -m coin.simulation')
+    arg_parser.add_argument('-d', '--duration', default=15.0, type=float,
+                            help="virtual duration of the simulation in seconds, defaults to 15")
+    arg_parser.add_argument('--seed', default=0, type=int, help="random seed, defaults to 0")
+    arg_parser.add_argument('--difficulty', default=Bogchain.difficulty, type=int,
+                            help=f"proof of work difficulty, defaults to {Bogchain.difficulty}")
+    arg_parser.add_argument('--hash-rate', default=1e6, type=float,
+                            help="simulated hashes per second of every node, defaults to 1e6")
+    arg_parser.add_argument('--keys', default=1, type=int,
+                            help="number of distinct key pairs handed out to nodes, defaults to 1")
+    arg_parser.add_argument('-n', '--node', action='append', required=True,
+                            help="node options in app.py format, e.g. \"-p 5001 -G -s schedule.txt\"")
+
+    cl_args = arg_parser.parse_args()
+
+    Bogchain.difficulty = cl_args.difficulty
+    simulation = Simulation(seed=cl_args.seed, hash_rate=cl_args.hash_rate, keys=cl_args.keys)
+
+    for options in cl_args.node:
+        node_args = node_arguments(options)
+        simulation.add_node(node_args.port,
+                            genesis=node_args.genesis,
+                            schedule=node_args.schedule,
+                            accumulation_period=node_args.accumulation,
+                            throttle=node_args.throttle,
+                            relay_window=node_args.relay_window,
+                            max_peers=node_args.max_peers,
+                            max_outbound=node_args.max_outbound,
+                            prune_depth=node_args.prune_depth)
+
+    print(json.dumps(simulation.run(cl_args.duration), indent=2))
@@ -0,0 +1,99 @@
+"""Checkpoints of pruned part of the chain
+
+Blocks older than prune depth are folded into a snapshot: balances after
+the last pruned block and hashes of pruned block headers, the last of
+which has to be previous hash of the block following the snapshot.
+Pruned blocks can be archived to disk as json lines.
+
+Snapshots are final, received chains are never accepted if they differ
+from the local chain below its snapshot height.
+"""
+
+import json
+
+from coin import wire
+
+
+class Snapshot:
+    """Balances and header hashes of the chain up to given height
+
+    Attributes:
+        height (int): number of blocks covered by the snapshot
+        balances (dict): dict mapping node ids to their balances after the last covered block
+        headers (list): hashes of covered block headers, position in the list is block index
+        transaction_ids (set): ids of transactions in covered blocks, so they are never mined again
+    """
+
+    def __init__(self, height=0, balances=None, headers=None, transaction_ids=None):
+        self.height = height
+        self.balances = balances if balances is not None else {}
+        self.headers = headers if headers is not None else []
+        self.transaction_ids = transaction_ids if transaction_ids is not None else set()
+
+    @property
+    def last_hash(self):
+        """hash of the last covered block, None for empty snapshot"""
+        return self.headers[-1] if self.headers else None
+
+    def copy(self):
+        """return copy of the snapshot that can be extended without affecting the original"""
+        return Snapshot(self.height, dict(self.balances), list(self.headers), set(self.transaction_ids))
+
+    def apply(self, blocks):
+        """fold blocks following the snapshot into it
+
+        Parameters:
+            blocks (list): list of coin.Block, first one at snapshot height
+        """
+        for block in blocks:
+            for transaction in block.transactions:
+                self.transaction_ids.add(transaction.id)
+                self.balances[transaction.sender] = self.balances.get(transaction.sender, 0) - transaction.amount
+                if transaction.recipient != transaction.sender:
+                    self.balances[transaction.recipient] = \
+                        self.balances.get(transaction.recipient, 0) + transaction.amount
+
+            self.headers.append(block.hash)
+            self.height += 1
+
+    @classmethod
+    def from_dict(cls, snapshot_dict):
+        """create snapshot from its dict view
+
+        Raises:
+            KeyError: when dict misses one of the snapshot keys
+            ValueError: when number of headers doesn't match height
+        """
+        snapshot = cls(snapshot_dict['height'],
+                       dict(snapshot_dict['balances']),
+                       list(snapshot_dict['headers']),
+                       set(snapshot_dict['transaction_ids']))
+
+        if len(snapshot.headers) != snapshot.height:
+            raise ValueError("Number of snapshot headers doesn't match its height")
+
+        return snapshot
+
+    def to_dict(self):
+        """return dict view of the snapshot"""
+        return {'height': self.height,
+                'balances': self.balances,
+                'headers': self.headers,
+                'transaction_ids': sorted(self.transaction_ids)}
+
+    @property
+    def hash(self):
+        """sha-256 digest of the canonical form of the snapshot, used to trust snapshots received from peers"""
+        return wire.digest(self.to_dict())
+
+
+def archive_blocks(path, blocks):
+    """append blocks to archive file, one json encoded block per line
+
+    Parameters:
+        path (str): path of the archive file
+        blocks (list): list of coin.Block
+    """
+    with open(path, 'a') as f:
+        for block in blocks:
+            f.write(json.dumps(block.to_dict()) + '\n')
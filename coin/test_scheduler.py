@@ -1,13 +1,70 @@
 import requests
 import json
-import time
-import random
+import math
+import threading
 
-from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+
+from coin import wire
+from coin.block import Block, BlockTemplate, Transaction
+from coin.key_pair import KeyPair, fingerprint
+from coin.clock import Clock
 
 # todo add parameters to each method
 
 
+class ScheduleError(ValueError):
+    """Schedule file contains invalid commands
+
+    Attributes:
+        errors (list): description of every invalid line
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('\n'.join(errors))
+
+
+class Step:
+    """Single compiled schedule command
+
+    Attributes:
+        line_number (int): line of the schedule file
+        sleep_time (float): time to sleep before each call
+        method_name (str): name of the scheduler method
+        method (callable): bound scheduler method, None for sleep
+        args (list): method arguments
+        repeat (int): number of calls, set with loop prefix
+        load (tuple): (rate, duration) for rate commands, None otherwise
+    """
+
+    __slots__ = ('line_number', 'sleep_time', 'method_name', 'method', 'args', 'repeat', 'load')
+
+    def __init__(self, line_number, sleep_time, method_name, method, args, repeat=1, load=None):
+        self.line_number = line_number
+        self.sleep_time = sleep_time
+        self.method_name = method_name
+        self.method = method
+        self.args = args
+        self.repeat = repeat
+        self.load = load
+
+
+class ParallelBlock:
+    """Steps started at the same moment and run concurrently
+
+    Attributes:
+        line_number (int): line of the schedule file opening the block
+        steps (list): list of coin.test_scheduler.Step
+    """
+
+    __slots__ = ('line_number', 'steps')
+
+    def __init__(self, line_number):
+        self.line_number = line_number
+        self.steps = []
+
+
 class TestScheduler:
     """Class responsible for automatic access to application endpoints
     and communication with other applications in the network.
@@ -17,7 +74,7 @@ class TestScheduler:
 
     [loop] [n] sleep_time method_name [target] [args ...]
 
-    sleep_time: floating point value passed to time.sleep before command is executed
+    sleep_time: floating point value passed to clock sleep before command is executed
         put 0 for no sleep time
     method_name: method to be called by the scheduler
     target: url of another application
@@ -27,6 +84,29 @@ class TestScheduler:
 
     Line can be escaped by placing '#' at its beginning.
 
+    Prepending line with rate r/s for ds turns it into open loop load generator:
+    after sleep_time method is called r times per second for d seconds by
+    concurrent workers, regardless of how long previous calls take. For
+    methods submitting transactions (dummy_transaction) time until transaction
+    appears in a block of this app's chain is recorded too, so app should be
+    registered with the target. Latency percentiles are logged at the end of
+    the run. Rate can't be used with methods that send no request (sleep, kill,
+    forge_chain). Example:
+
+    rate 500/s for 60s 0 dummy_transaction 127.0.0.1:5001 alice bob 1
+
+    Lines enclosed in parallel block are started at the same moment and run
+    concurrently, each with its own sleep times. Block finishes when all of
+    them finish, blocks can not be nested. Example:
+
+    parallel {
+    0 transfer 127.0.0.1:5002 10
+    0 transfer 127.0.0.1:5003 10
+    }
+
+    Whole file is compiled into a plan before anything is executed, invalid
+    lines are reported together with coin.test_scheduler.ScheduleError.
+
     Attributes:
         app_kill_event (threading.Event): Event handle allowing for graceful exit
             from separate thread
@@ -35,22 +115,38 @@ class TestScheduler:
                                   logger and application id
         key_pair (coin.KeyPair): KeyPair object for signing requests
         url (str): url of the application using TestScheduler
-        allowed (list): list of methods that can be called
+        allowed (dict): dict mapping methods that can be called to number of their arguments
         self_targeted (list): list of methods that are making request on app calling them
+        load_workers (int): number of concurrent workers used by rate command
+        inclusion_timeout (float): time in seconds rate command waits for submitted
+            transactions to appear in the chain after last request is sent
+        load_reports (list): list of dicts with results of finished rate commands
+        dummy_keys (dict): dict mapping fake sender names to their key pairs
+        sign_transactions (bool): sign fake transactions, disabled in simulations
+            where signatures are not verified
     """
 
-    allowed = [
-        'register',
-        'test',
-        'transfer',
-        'dummy_transaction',
-        'kill',
-        'forge_chain',
-        'sleep'
-    ]
+    allowed = {
+        'register': 1,
+        'test': 1,
+        'transfer': 2,
+        'dummy_transaction': 4,
+        'dummy_batch': 5,
+        'transfer_batch': 3,
+        'kill': 0,
+        'forge_chain': 2,
+        'profile': 1,
+        'sleep': 0
+    }
 
     self_targeted = ['dummy_transactios', 'transfer']
 
+    # methods sending a single request and returning its response, only they can generate load
+    load_methods = ('register', 'test', 'transfer', 'dummy_transaction', 'dummy_batch', 'transfer_batch', 'profile')
+
+    load_workers = 32
+    inclusion_timeout = 30.0
+
     def __init__(self, schedule_file, **kwargs):
         """Inits TestScheduler
 
@@ -64,44 +160,316 @@ class TestScheduler:
                                       logger and application id
             key_pair (coin.KeyPair): KeyPair object for signing requests
             url (str): url of the application using TestScheduler
+            clock (coin.Clock): source of time and randomness, defaults to real time clock
+            session: object with requests like post method shared by all threads, each thread
+                uses its own requests.Session if not provided
+            sign_transactions (bool): sign fake transactions, defaults to True
         """
         self.schedule_file = schedule_file
         self.app_kill_event = kwargs['app_kill_event']
         self.bogchain = kwargs['bogchain']
         self.key_pair = kwargs['key_pair']
         self.url = kwargs['url']
+        self.load_reports = []
+        self.local = threading.local()
+        self.clock = kwargs['clock'] if kwargs.get('clock') is not None else Clock()
+        self.shared_session = kwargs.get('session')
+        self.dummy_keys = {}
+        self.sign_transactions = kwargs.get('sign_transactions', True)
+
+    @property
+    def session(self):
+        """requests session of the current thread, keeps connections to apps alive"""
+        if self.shared_session is not None:
+            return self.shared_session
+
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def compile(self):
+        """Parse and validate schedule file into a plan
+
+        Returns:
+            list: list of coin.test_scheduler.Step and coin.test_scheduler.ParallelBlock,
+                empty if app runs without schedule file
+
+        Raises:
+            ScheduleError: when any line of the schedule file is invalid
+        """
+        if self.schedule_file is None:
+            return []
 
-    def execute(self):
-        """Executes methods provided in schedule file"""
         with open(self.schedule_file, 'r') as f:
             lines = f.readlines()
 
-        for line in lines:
+        plan = []
+        errors = []
+        block = None
+
+        for line_number, line in enumerate(lines, 1):
             command_args = line.split()
 
-            if command_args[0] == '#':
+            if not command_args or command_args[0].startswith('#'):
+                continue
+
+            if command_args in (['parallel', '{'], ['parallel{']):
+                if block is not None:
+                    errors.append(f"line {line_number}: parallel blocks can not be nested")
+                block = ParallelBlock(line_number)
+                continue
+
+            if command_args == ['}']:
+                if block is None:
+                    errors.append(f"line {line_number}: closing brace without parallel block")
+                else:
+                    plan.append(block)
+                    block = None
                 continue
 
-            loop_n_times = 1
+            try:
+                step = self.compile_step(line_number, command_args)
+            except ValueError as e:
+                errors.append(f"line {line_number}: {e}")
+                continue
+
+            if block is not None:
+                block.steps.append(step)
+            else:
+                plan.append(step)
+
+        if block is not None:
+            errors.append(f"line {block.line_number}: parallel block is not closed")
+
+        if errors:
+            raise ScheduleError(errors)
+
+        return plan
+
+    def compile_step(self, line_number, command_args):
+        """Compile single schedule line
+
+        Parameters:
+            line_number (int): line of the schedule file
+            command_args (list): line split into words
+
+        Returns:
+            coin.test_scheduler.Step: compiled command
+
+        Raises:
+            ValueError: when line is invalid
+        """
+        repeat = 1
+        load = None
+
+        if command_args[0] == "loop":
+            if len(command_args) < 2 or not command_args[1].isdigit():
+                raise ValueError("loop needs number of repetitions")
+            repeat = int(command_args[1])
+            command_args = command_args[2:]
+
+        elif command_args[0] == "rate":
+            if len(command_args) < 4 or command_args[2] != 'for' or not command_args[1].endswith('/s') \
+                    or not command_args[3].endswith('s'):
+                raise ValueError("rate needs form: rate r/s for ds")
+            try:
+                load = (float(command_args[1][:-2]), float(command_args[3][:-1]))
+            except ValueError:
+                raise ValueError("rate and duration have to be numbers")
+            if load[0] <= 0:
+                raise ValueError("rate has to be positive")
+            command_args = command_args[4:]
+
+        if len(command_args) < 2:
+            raise ValueError("missing sleep time or method name")
+
+        try:
+            sleep_time = float(command_args[0])
+        except ValueError:
+            raise ValueError(f"invalid sleep time {command_args[0]}")
+
+        method_name = command_args[1]
+        args = command_args[2:]
+
+        if method_name not in self.allowed:
+            raise ValueError(f"unknown method {method_name}")
+
+        if len(args) != self.allowed[method_name]:
+            raise ValueError(f"{method_name} takes {self.allowed[method_name]} arguments, {len(args)} given")
+
+        if load is not None and method_name not in self.load_methods:
+            raise ValueError(f"rate can't be used with {method_name}, it sends no request")
+
+        method = getattr(self, method_name) if method_name != "sleep" else None
 
-            if command_args[0] == "loop":
-                loop_n_times = int(command_args[1])
-                command_args = command_args[2:]
+        return Step(line_number, sleep_time, method_name, method, args, repeat, load)
 
-            if command_args[1] in self.allowed:
-                for _ in range(loop_n_times):
-                    self.log(command_args)
+    def execute(self, plan=None):
+        """Executes methods provided in schedule file
 
-                    sleep_time = float(command_args[0])
+        Parameters:
+            plan (list): plan returned by compile, schedule file is compiled if not provided
+        """
+        if plan is None:
+            try:
+                plan = self.compile()
+            except ScheduleError as e:
+                self.bogchain.logger.error(f"Invalid schedule file {self.schedule_file}\n{e}")
+                return
+
+        for item in plan:
+            if isinstance(item, ParallelBlock):
+                self.run_parallel(item)
+            else:
+                self.run_step(item)
+
+    def run_step(self, step, barrier=None):
+        """Run compiled command
+
+        Parameters:
+            step (coin.test_scheduler.Step): command to run
+            barrier (threading.Barrier): barrier awaited before first sleep by steps of
+                parallel block
+        """
+        if barrier is not None:
+            barrier.wait()
+
+        for _ in range(step.repeat):
+            self.log([step.sleep_time, step.method_name, *step.args])
+
+            if step.sleep_time > 0:
+                self.clock.sleep(step.sleep_time)
+
+            if step.load is not None:
+                self.generate_load(*step.load, step.method, step.args)
+            elif step.method is not None:
+                step.method(*step.args)
 
-                    if sleep_time > 0:
-                        time.sleep(sleep_time)
+    def run_parallel(self, block):
+        """Run steps of parallel block concurrently, each in its own thread"""
+        if not block.steps:
+            return
 
-                    if command_args[1] == "sleep":
-                        continue
+        barrier = threading.Barrier(len(block.steps))
 
-                    method = getattr(self, command_args[1])
-                    method(*command_args[2:])
+        with ThreadPoolExecutor(max_workers=len(block.steps)) as executor:
+            futures = [executor.submit(self.run_step, step, barrier) for step in block.steps]
+
+        for future in futures:
+            if future.exception() is not None:
+                self.bogchain.logger.error(f"Parallel step failed: {future.exception()!r}")
+
+    def generate_load(self, rate, duration, method, args):
+        """Call method at constant rate using concurrent workers
+
+        Calls are scheduled upfront, latency is measured from scheduled time, so
+        saturated app or workers show up as growing latency instead of lower rate.
+
+        Parameters:
+            rate (float): calls per second
+            duration (float): time in seconds during which calls are made
+            method (callable): bound scheduler method
+            args (list): method arguments
+
+        Returns:
+            dict: load report
+        """
+        total = int(rate * duration)
+        lock = threading.Lock()
+        request_latencies = []
+        submitted = {}
+        included = {}
+        failures = []
+        sending_finished = threading.Event()
+
+        def call(scheduled_at):
+            try:
+                response = method(*args)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                with lock:
+                    failures.append(e.__class__.__name__)
+                return
+            except Exception as e:
+                # exception would otherwise stay unnoticed in the discarded future
+                self.bogchain.logger.exception(f"Load call {method.__name__} failed")
+                with lock:
+                    failures.append(e.__class__.__name__)
+                return
+
+            with lock:
+                request_latencies.append(self.clock.monotonic() - scheduled_at)
+                transaction_id = TestScheduler.transaction_id(response)
+                if transaction_id is not None:
+                    submitted[transaction_id] = scheduled_at
+
+        def watch_inclusion():
+            deadline = None
+
+            while True:
+                with lock:
+                    pending = [(i, t) for i, t in submitted.items() if i not in included]
+
+                now = self.clock.monotonic()
+                for transaction_id, scheduled_at in pending:
+                    if self.bogchain.in_chain(transaction_id):
+                        included[transaction_id] = now - scheduled_at
+
+                if sending_finished.is_set():
+                    deadline = deadline or now + self.inclusion_timeout
+                    if len(included) == len(submitted) or now > deadline:
+                        return
+
+                self.clock.sleep(0.05)
+
+        watcher = threading.Thread(target=watch_inclusion, daemon=True)
+        watcher.start()
+
+        start_time = self.clock.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.load_workers) as executor:
+            for i in range(total):
+                scheduled_at = start_time + i / rate
+                delay = scheduled_at - self.clock.monotonic()
+
+                if delay > 0:
+                    self.clock.sleep(delay)
+
+                executor.submit(call, scheduled_at)
+
+        elapsed = self.clock.monotonic() - start_time
+        sending_finished.set()
+        watcher.join()
+
+        report = {
+            'method': method.__name__,
+            'target_rate': rate,
+            'achieved_rate': round(len(request_latencies) / elapsed, 1) if elapsed > 0 else None,
+            'requests': total,
+            'failed': len(failures),
+            'request_latency': percentiles(request_latencies),
+            'submitted_transactions': len(submitted),
+            'included_transactions': len(included),
+            'inclusion_latency': percentiles(list(included.values()))
+        }
+
+        self.load_reports.append(report)
+        self.bogchain.logger.info(f"Load report {json.dumps(report)}")
+
+        return report
+
+    @staticmethod
+    def transaction_id(response):
+        """id of transaction posted in request, None if request body was not a transaction"""
+        body = response.request.body
+
+        if not body:
+            return None
+
+        try:
+            return json.loads(body).get('id')
+        except (ValueError, AttributeError):
+            return None
 
     def log(self, command_args):
         target = command_args[2] if [] else "self"
@@ -117,12 +485,15 @@ class TestScheduler:
             dict: dict with origin header and signature header
         """
 
-        signature = self.key_pair.sign(json.dumps(data, sort_keys=True))
+        signature = self.key_pair.sign(wire.canonical(data))
         return {'origin-id': self.bogchain.node_id, 'signature': signature}
 
     def register(self, *args):
         """registers application with remote remote application
 
+        If remote application has no room for new peers, application joins
+        the network through sample of its peers instead.
+
         Usage:
             sleep_time register url_of_app
         """
@@ -131,7 +502,12 @@ class TestScheduler:
             'node_id': self.bogchain.node_id,
             'pub_key': self.key_pair.pub_key}
 
-        requests.post(f"http://{args[0]}/nodes/register", json=register_json)
+        response = self.session.post(f"http://{args[0]}/nodes/register", json=register_json)
+
+        if response.status_code == 503:
+            self.bogchain.update_peers(response.json()['peers'])
+
+        return response
 
     def test(self, *args):
         """access to the test endpoint
@@ -141,9 +517,23 @@ class TestScheduler:
         """
         test_json = {'dummy': "dummy"}
 
-        requests.post(f"http://{args[0]}/test",
-                      json=test_json,
-                      headers=self.get_headers(test_json))
+        return self.session.post(f"http://{args[0]}/test",
+                                 json=test_json,
+                                 headers=self.get_headers(test_json))
+
+    def dummy_key(self, sender):
+        """return key pair standing for fake sender, generated on first use"""
+        return self.dummy_keys.setdefault(sender, KeyPair())
+
+    def dummy(self, sender, recipient, amount):
+        """create fake transaction dict signed with fake sender key, sender id is key fingerprint"""
+        if not self.sign_transactions:
+            return Transaction(sender, recipient, amount, str(self.clock.uuid())).to_dict()
+
+        key_pair = self.dummy_key(sender)
+        transaction = Transaction(fingerprint(key_pair.pub_key), recipient, amount, str(self.clock.uuid()))
+        transaction.sign(key_pair)
+        return transaction.to_dict()
 
     def dummy_transaction(self, *args):
         """Creates fake transaction dict and immediately submits it for mining
@@ -151,16 +541,11 @@ class TestScheduler:
         Usage:
             sleep_time dummy_transaction url_of_app sender recipient amount
         """
-        transaction_json = {
-            'sender': args[1],
-            'recipient': args[2],
-            'amount': args[3],
-            'id': str(uuid4())
-        }
+        transaction_json = self.dummy(args[1], args[2], int(args[3]))
 
-        requests.post(f"http://{args[0]}/transactions/process",
-                      json=transaction_json,
-                      headers=self.get_headers(transaction_json))
+        return self.session.post(f"http://{args[0]}/transactions/process",
+                                 json=transaction_json,
+                                 headers=self.get_headers(transaction_json))
 
     def transfer(self, *args):
         """Creates new valid transaction dict
@@ -176,7 +561,52 @@ class TestScheduler:
             'amount': amount
         }
 
-        requests.post(f"{self.url}/transactions/new", json=transaction_json, headers=self.get_headers(transaction_json))
+        return self.session.post(f"{self.url}/transactions/new",
+                                 json=transaction_json,
+                                 headers=self.get_headers(transaction_json))
+
+    def profile(self, *args):
+        """Opens profiling window of the app, statistics are then served by /profile
+
+        Usage:
+            sleep_time profile duration
+        """
+        profile_json = {'duration': float(args[0])}
+
+        return self.session.post(f"{self.url}/profile",
+                                 json=profile_json,
+                                 headers=self.get_headers(profile_json))
+
+    def dummy_batch(self, *args):
+        """Creates batch of fake transaction dicts and submits it for mining under single signature
+
+        Usage:
+            sleep_time dummy_batch url_of_app sender recipient amount batch_size
+        """
+        batch_json = {
+            'transactions': [self.dummy(args[1], args[2], int(args[3])) for _ in range(int(args[4]))]
+        }
+
+        return self.session.post(f"http://{args[0]}/transactions/process/batch",
+                                 json=batch_json,
+                                 headers=self.get_headers(batch_json))
+
+    def transfer_batch(self, *args):
+        """Creates batch of new valid transaction dicts
+
+        Usage:
+            sleep_time transfer_batch recipients_url amount batch_size
+        """
+        recipient = self.bogchain.peers.node_ids[f"http://{args[0]}"]
+        amount = int(args[1])
+
+        batch_json = {
+            'transactions': [{'recipient': recipient, 'amount': amount} for _ in range(int(args[2]))]
+        }
+
+        return self.session.post(f"{self.url}/transactions/new/batch",
+                                 json=batch_json,
+                                 headers=self.get_headers(batch_json))
 
     def forge_chain(self, *args):
         """Forge fake blockchain and submit it for update
@@ -193,47 +623,37 @@ class TestScheduler:
 
         fake_chain = []
 
-        if len(self.bogchain.chain) == 0:
+        if self.bogchain.height == 0:
             genesis_transactions = [self.bogchain.create_transaction('mint',
                                                                      self.bogchain.node_id,
-                                                                     self.bogchain.mining_bounty)]
-            genesis_block = {
-                'index': 0,
-                'timestamp': time.time(),
-                'transactions': genesis_transactions,
-                'proof': 100,
-                'previous_hash': 'gen'
-            }
+                                                                     self.bogchain.founder_bounty)]
+            genesis_block = Block(0, self.clock.time(), genesis_transactions, 100, 'gen')
 
             fake_chain.append(genesis_block)
         else:
+            # with pruned chain forging starts from the oldest block kept in memory
             fake_chain.append(self.bogchain.chain[0])
 
         fake_length = int(args[0])
         block_amount = int(args[1])
 
-        for i in range(1, fake_length):
+        # fake length counts pruned blocks too
+        while fake_chain[-1].index + 1 < fake_length:
             fake_transactions = [self.bogchain.create_transaction(
-                random.sample(self.bogchain.peers.addresses_pub_keys.keys(), 1),  # choose random peer as target
+                self.clock.random.choice(list(self.bogchain.peers.addresses_pub_keys)),  # choose random peer as target
                 self.bogchain.node_id,
                 block_amount
             )]
 
-            previous_block = fake_chain[i - 1]
-
-            proof = self.bogchain.proof_of_work(previous_block['proof'])
+            previous_block = fake_chain[-1]
 
-            fake_block = {
-                'index': len(fake_chain),
-                'timestamp': time.time(),
-                'transactions': fake_transactions,
-                'proof': proof,
-                'previous_hash': self.bogchain.hash(previous_block)
-            }
+            template = BlockTemplate(previous_block.index + 1, self.clock.time(), self.bogchain.hash(previous_block),
+                                     fake_transactions)
+            proof = self.bogchain.proof_of_work(template.work_hash)
 
-            fake_chain.append(fake_block)
+            fake_chain.append(template.block(proof))
 
-        self.bogchain.chain = fake_chain
+        self.bogchain.replace_chain(fake_chain)
         self.bogchain.gossip.flood('/update', self.bogchain.current_state, self.bogchain.peers.addresses)
 
     def kill(self):
@@ -244,3 +664,22 @@ class TestScheduler:
         """
         self.app_kill_event.set()
 
+
+def percentiles(values):
+    """summarize latencies in seconds
+
+    Parameters:
+        values (list): measured latencies
+
+    Returns:
+        dict: p50, p90, p99 and max latency in milliseconds, None values for empty list
+    """
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+
+    values = sorted(values)
+
+    def nearest_rank(percent):
+        return round(values[max(math.ceil(len(values) * percent / 100) - 1, 0)] * 1e3, 3)
+
+    return {'p50': nearest_rank(50), 'p90': nearest_rank(90), 'p99': nearest_rank(99), 'max': round(values[-1] * 1e3, 3)}
@@ -0,0 +1,118 @@
+"""Verification of transaction signatures
+
+Checking RSA signature of every transaction in a received chain is slow,
+so verified transactions are remembered in a bounded cache and only new
+ones are checked. Large sets of new transactions are split into chunks
+verified in parallel by a process pool, small ones are verified in place
+where pickling them would cost more than the verification itself.
+"""
+
+import multiprocessing
+import os
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from coin.block import valid_signature
+from coin import metrics
+
+
+def verify_chunk(cache_keys):
+    """verify chunk of transactions in worker process
+
+    Parameters:
+        cache_keys (list): list of coin.Transaction.cache_key
+
+    Returns:
+        bool: True if all signatures are valid
+    """
+    return all(valid_signature(cache_key) for cache_key in cache_keys)
+
+
+class TransactionVerifier:
+    """Verifies transaction signatures and caches verified transactions
+
+    Attributes:
+        cache (collections.OrderedDict): cache keys of verified transactions in order
+            of their use, least recently used are evicted first
+        cache_size (int): maximal number of cached transactions
+        workers (int): number of worker processes, pool is not used with single worker
+        parallel_threshold (int): minimal number of new transactions verified in the pool
+        executor (concurrent.futures.ProcessPoolExecutor): worker pool, created on first use
+    """
+
+    def __init__(self, **kwargs):
+        """Inits TransactionVerifier
+
+        Keyword Arguments:
+            cache_size (int): maximal number of cached transactions, defaults to 100000
+            workers (int): number of worker processes, defaults to number of cpus
+            parallel_threshold (int): minimal number of transactions verified in the pool, defaults to 256
+        """
+        self.cache = OrderedDict()
+        self.cache_size = kwargs.get('cache_size', 100000)
+        self.workers = kwargs.get('workers') or os.cpu_count() or 1
+        self.parallel_threshold = kwargs.get('parallel_threshold', 256)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def cached(self, cache_key):
+        with self.lock:
+            if cache_key in self.cache:
+                self.cache.move_to_end(cache_key)
+                return True
+        return False
+
+    def remember(self, cache_keys):
+        with self.lock:
+            for cache_key in cache_keys:
+                self.cache[cache_key] = None
+                self.cache.move_to_end(cache_key)
+
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def verify(self, transactions):
+        """check signatures of transactions that were not verified before
+
+        Parameters:
+            transactions (iterable): coin.Transaction objects
+
+        Returns:
+            bool: True if all signatures are valid
+        """
+        new = [transaction.cache_key for transaction in transactions if transaction.sender != 'mint']
+        new = list(dict.fromkeys(cache_key for cache_key in new if not self.cached(cache_key)))
+
+        metrics.verified_transactions.inc(len(new))
+
+        if not new:
+            return True
+
+        if self.workers > 1 and len(new) >= self.parallel_threshold:
+            valid = self.verify_parallel(new)
+        else:
+            valid = verify_chunk(new)
+
+        if valid:
+            self.remember(new)
+
+        return valid
+
+    def verify_parallel(self, cache_keys):
+        if self.executor is None:
+            # spawned workers don't inherit state of flask and mining threads
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+
+        chunk_size = -(-len(cache_keys) // self.workers)
+        chunks = [cache_keys[i:i + chunk_size] for i in range(0, len(cache_keys), chunk_size)]
+
+        return all(self.executor.map(verify_chunk, chunks))
+
+    def shutdown(self):
+        """stop worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
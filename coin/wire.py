@@ -0,0 +1,259 @@
+"""Wire formats used for communication between nodes
+
+Payloads can travel either as JSON or, when msgpack is installed, as
+compact msgpack. Format actually used between two nodes is negotiated with
+http headers: every response advertises formats accepted by the app in
+Accept-Post header and sender switches to the best format peer accepts.
+
+Large payloads may additionally be compressed with gzip or, when zstandard
+is installed, zstd. Accepted encodings are advertised the same way in
+Accept-Encoding response header.
+
+Regardless of the wire format hashing and signing always operate on
+canonical form produced by canonical function, so signature of a payload
+does not depend on how it was transferred.
+"""
+
+import io
+import json
+import hashlib
+import threading
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+formats = [MSGPACK, JSON] if msgpack is not None else [JSON]
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+
+encodings = [ZSTD, GZIP] if zstandard is not None else [GZIP]
+decompression_errors = (zlib.error, zstandard.ZstdError) if zstandard is not None else (zlib.error,)
+
+max_decompressed_size = 64 * 1024 * 1024
+
+
+def canonical(data):
+    """serialize data into canonical form used for hashing and signing
+
+    Parameters:
+        data (dict): payload, block or transaction
+
+    Returns:
+        str: json with sorted keys and no insignificant whitespace
+    """
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def digest(data):
+    """sha-256 hex digest of the canonical form of data"""
+    return hashlib.sha256(canonical(data).encode()).hexdigest()
+
+
+def encode(data, mimetype=JSON):
+    """encode payload for sending
+
+    Parameters:
+        data (dict): payload to be encoded
+        mimetype (str): one of the formats, defaults to json
+
+    Returns:
+        bytes: encoded payload
+    """
+    if mimetype == MSGPACK and msgpack is not None:
+        return msgpack.packb(data, use_bin_type=True)
+
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def decode(body, mimetype=JSON):
+    """decode received payload
+
+    Parameters:
+        body (bytes): raw request or response body
+        mimetype (str): content type of the body
+
+    Returns:
+        dict: decoded payload, None if content type is not supported or
+            body is malformed
+    """
+    try:
+        if mimetype == MSGPACK:
+            if msgpack is None:
+                return None
+            return msgpack.unpackb(body, raw=False)
+
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def negotiate(accept_post):
+    """choose best format accepted by a peer
+
+    Parameters:
+        accept_post (str): value of Accept-Post header sent by peer, None
+            if peer did not advertise accepted formats
+
+    Returns:
+        str: mimetype to be used for requests to that peer
+    """
+    if not accept_post:
+        return JSON
+
+    accepted = [mimetype.strip() for mimetype in accept_post.split(',')]
+
+    for mimetype in formats:
+        if mimetype in accepted:
+            return mimetype
+
+    return JSON
+
+
+def negotiate_encoding(accept_encoding):
+    """choose best compression accepted by a peer
+
+    Parameters:
+        accept_encoding (str): value of Accept-Encoding header sent by peer, None
+            if peer did not advertise accepted encodings
+
+    Returns:
+        str: content encoding to be used for requests to that peer
+    """
+    if not accept_encoding:
+        return IDENTITY
+
+    accepted = [encoding.strip() for encoding in accept_encoding.split(',')]
+
+    for encoding in encodings:
+        if encoding in accepted:
+            return encoding
+
+    return IDENTITY
+
+
+def compress(body, encoding):
+    """compress encoded payload
+
+    Parameters:
+        body (bytes): encoded payload
+        encoding (str): one of the encodings
+
+    Returns:
+        bytes: compressed body
+    """
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == GZIP:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
+
+    return body
+
+
+def decompress(body, encoding):
+    """decompress received body
+
+    Parameters:
+        body (bytes): raw request body
+        encoding (str): value of Content-Encoding header, None if not compressed
+
+    Returns:
+        bytes: decompressed body, None if encoding is not supported, body is
+            malformed or exceeds max_decompressed_size
+    """
+    if not encoding or encoding == IDENTITY:
+        return body
+
+    try:
+        if encoding == ZSTD and zstandard is not None:
+            # streamed, so memory is bounded by the limit and not by size declared in the frame header
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as reader:
+                decompressed = reader.read(max_decompressed_size + 1)
+        elif encoding == GZIP:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            decompressed = decompressor.decompress(body, max_decompressed_size)
+            if decompressor.unconsumed_tail:
+                return None
+        else:
+            return None
+    except decompression_errors:
+        return None
+
+    if len(decompressed) > max_decompressed_size:
+        return None
+
+    return decompressed
+
+
+class CompressionStats:
+    """Bytes saved by compression and cpu time spent on it
+
+    Payloads are grouped into buckets by their uncompressed size rounded up
+    to the power of two kilobytes.
+
+    Attributes:
+        totals (dict): totals over all compressed payloads
+        buckets (dict): dict mapping bucket upper bound in bytes to totals of
+            payloads falling into it
+    """
+
+    def __init__(self):
+        self.totals = CompressionStats.empty()
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def empty():
+        return {'payloads': 0, 'raw_bytes': 0, 'sent_bytes': 0, 'cpu_seconds': 0.0}
+
+    def record(self, raw_size, sent_size, cpu_seconds):
+        """add single compressed payload to stats
+
+        Parameters:
+            raw_size (int): size of payload before compression
+            sent_size (int): size of payload after compression
+            cpu_seconds (float): time spent compressing
+        """
+        bucket = 1024
+        while bucket < raw_size:
+            bucket *= 2
+
+        # flood sends from several threads at once
+        with self.lock:
+            for totals in (self.totals, self.buckets.setdefault(bucket, CompressionStats.empty())):
+                totals['payloads'] += 1
+                totals['raw_bytes'] += raw_size
+                totals['sent_bytes'] += sent_size
+                totals['cpu_seconds'] += cpu_seconds
+
+    @staticmethod
+    def summary(totals):
+        """totals extended with bytes saved and cpu cost per megabyte"""
+        raw_megabytes = totals['raw_bytes'] / 1e6
+        return {
+            **totals,
+            'bytes_saved': totals['raw_bytes'] - totals['sent_bytes'],
+            'cpu_ms_per_mb': round(totals['cpu_seconds'] * 1e3 / raw_megabytes, 3) if raw_megabytes else 0.0
+        }
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'total': CompressionStats.summary(self.totals),
+                'by_size': {str(bucket): CompressionStats.summary(totals)
+                            for bucket, totals in sorted(self.buckets.items())}
+            }
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# stream events of all apps in the network instead of polling their chains
+# * param1 - number of nodes in the network (assumes port numbers going from 5001 up)
+# * param2 - optional comma separated kinds of events: block, reorg, transaction
+for i in $(seq $1)
+    do
+    curl -sN "localhost:500$i/events?kinds=$2" | sed -u "s/^/500$i /" &
+done
+
+trap 'pkill -P $$' EXIT
+wait
@@ -0,0 +1,71 @@
+import logging
+import unittest
+
+from coin.block import BlockTemplate
+from coin.bogchain import Bogchain
+from coin.clock import SimulatedClock
+from coin.key_pair import KeyPair, fingerprint
+from coin.verification import TransactionVerifier
+
+
+class ReplayedTransactionTest(unittest.TestCase):
+    """received chains can't include the same signed transaction twice"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.alice = KeyPair()
+
+    def setUp(self):
+        self.difficulty = Bogchain.difficulty
+        Bogchain.difficulty = 1
+        self.clock = SimulatedClock(0)
+        self.miner = self.bogchain('miner')
+        self.miner.create_genesis_block()
+
+    def tearDown(self):
+        Bogchain.difficulty = self.difficulty
+
+    def bogchain(self, node_id):
+        return Bogchain(node_id=node_id, gossip=None, logger=logging.getLogger(__name__), clock=self.clock,
+                        verifier=TransactionVerifier(workers=1))
+
+    def transfer(self, transaction_id):
+        transaction = self.miner.create_transaction(fingerprint(self.alice.pub_key), 'bob', 50)
+        transaction.id = transaction_id
+        transaction.sign(self.alice)
+        return transaction
+
+    def mine(self, chain, transactions):
+        """return chain extended with block mined by the miner"""
+        coinbase = self.miner.create_transaction('mint', 'miner', Bogchain.mining_bounty)
+        template = BlockTemplate(chain[-1].index + 1, self.clock.time(), chain[-1].hash, [coinbase, *transactions])
+        return chain + [template.block(self.miner.proof_of_work(template.work_hash))]
+
+    def test_transaction_in_one_block_is_accepted(self):
+        chain = self.mine(self.miner.chain, [self.transfer('tx-1')])
+        receiver = self.bogchain('receiver')
+
+        self.assertTrue(receiver.update_chain([block.to_dict() for block in chain]))
+        self.assertEqual(receiver.balance('bob'), 50)
+
+    def test_transaction_replayed_in_received_blocks_is_rejected(self):
+        chain = self.mine(self.mine(self.miner.chain, [self.transfer('tx-1')]), [self.transfer('tx-1')])
+        receiver = self.bogchain('receiver')
+
+        self.assertFalse(receiver.update_chain([block.to_dict() for block in chain]))
+        self.assertEqual(receiver.balance('bob'), 0)
+
+    def test_transaction_replayed_after_kept_blocks_is_rejected(self):
+        chain = self.mine(self.miner.chain, [self.transfer('tx-1')])
+        receiver = self.bogchain('receiver')
+        receiver.update_chain([block.to_dict() for block in chain])
+
+        # pruning peer sends only blocks following its snapshot
+        replayed = self.mine(chain, [self.transfer('tx-1')])[len(chain):]
+
+        self.assertFalse(receiver.update_chain([block.to_dict() for block in replayed]))
+        self.assertEqual(receiver.balance('bob'), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()